@@ -0,0 +1,126 @@
+import asyncio
+from typing import Callable, Awaitable
+
+from aiohttp import web
+
+from metrics import REGISTRY, Counter, Gauge
+from settings import get_option
+
+_WebHandler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+CLASS_AUTH = 'auth'
+CLASS_READ = 'read'
+CLASS_WRITE = 'write'
+
+AUTH_ROUTES = {'user_auth', 'user_register', 'user_logout'}
+# Observability endpoints must answer while the service is overloaded
+EXEMPT_ROUTES = {'metrics', 'healthz', 'readyz'}
+
+ADMISSION_IN_FLIGHT = REGISTRY.register(Gauge(
+    'admission_in_flight', 'Admitted requests being handled.', ('route_class',)))
+ADMISSION_QUEUED = REGISTRY.register(Gauge(
+    'admission_queued', 'Requests waiting for admission.', ('route_class',)))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    'admission_rejected_total', 'Requests rejected with 503.', ('route_class', 'reason')))
+
+
+class _Gate:
+    """ Ограничение числа одновременно обрабатываемых запросов одного класса """
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> str | None:
+        """ Причина отказа или None, если запрос допущен """
+
+        if self._semaphore.locked():
+            if self.queued >= self.max_queue:
+                return 'queue_full'
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                return 'queue_timeout'
+            finally:
+                self.queued -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.in_flight += 1
+        return None
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+class AdmissionController:
+
+    def __init__(self, config: dict[str, dict]):
+        options: dict = config.get('admission', {})
+        self._enabled: bool = get_option(options, 'enabled', True, bool)
+        self._retry_after: int = get_option(options, 'retry_after', 1, int)
+        max_queue: int = get_option(options, 'max_queue', 100, int)
+        queue_timeout: float = get_option(options, 'queue_timeout', 1.0, float)
+        self._gates: dict[str, _Gate] = {
+            name: _Gate(name, get_option(options, f'{name}_limit', default, int), max_queue, queue_timeout)
+            for name, default in ((CLASS_AUTH, 32), (CLASS_READ, 128), (CLASS_WRITE, 64))
+        }
+
+    def classify(self, request: web.Request) -> str | None:
+        name: str | None = request.match_info.route.name
+        if not self._enabled or name in EXEMPT_ROUTES or request.match_info.http_exception:
+            return None
+        if name in AUTH_ROUTES:
+            return CLASS_AUTH
+        return CLASS_READ if request.method in ('GET', 'HEAD') else CLASS_WRITE
+
+    def gate(self, route_class: str) -> _Gate:
+        return self._gates[route_class]
+
+    def gates(self) -> list[_Gate]:
+        return list(self._gates.values())
+
+    @property
+    def retry_after(self) -> int:
+        return self._retry_after
+
+
+@web.middleware
+async def admit(request: web.Request, handler: _WebHandler) -> web.StreamResponse:
+    """ Ограничение нагрузки: при переполнении очереди запрос сразу получает 503 """
+
+    controller: AdmissionController = request.app['admission']
+    route_class: str | None = controller.classify(request)
+    if route_class is None:
+        return await handler(request)
+
+    gate: _Gate = controller.gate(route_class)
+    reason: str | None = await gate.acquire()
+    if reason is not None:
+        ADMISSION_REJECTED.inc(route_class, reason)
+        raise web.HTTPServiceUnavailable(headers={'Retry-After': str(controller.retry_after)})
+
+    try:
+        return await handler(request)
+    finally:
+        gate.release()
+
+
+@REGISTRY.collector
+def _collect_admission(app: web.Application) -> None:
+    if 'admission' in app:
+        for gate in app['admission'].gates():
+            ADMISSION_IN_FLIGHT.set(gate.name, value=gate.in_flight)
+            ADMISSION_QUEUED.set(gate.name, value=gate.queued)
+
+
+def setup_admission(application: web.Application) -> None:
+    application['admission'] = AdmissionController(application['config'])
+    application.middlewares.append(admit)
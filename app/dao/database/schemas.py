@@ -1,11 +1,12 @@
-from datetime import datetime
 from sqlalchemy import (
     MetaData, Table, Column, ForeignKey,
-    Integer, String, DateTime, Enum,
+    Integer, String, DateTime, Enum, Float, Boolean, Text, func, false,
 )
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
 
-__all__ = ['user', 'role', 'pg_context']
+from settings import get_option
+
+__all__ = ['user', 'role', 'login_bucket', 'refresh_token', 'http_session', 'pg_context', 'engine_options', 'pool_stats', 'replica_hosts', 'all_engines']
 
 DSN = 'postgresql+asyncpg://{user}:{password}@{host}:{port}/{database}'
 
@@ -21,8 +22,11 @@ user = Table(
     Column('username', String(150),  unique=True, nullable=False),
     Column('password', String(200), nullable=False),
     Column('date_of_birth', DateTime(), nullable=True),
-    Column('created', DateTime(), default=datetime.now()),
-    Column('roles_id', Integer, ForeignKey('roles.id', ondelete='RESTRICT'))
+    # Naive UTC: now() cast to timestamp without time zone would be in the session's TimeZone
+    Column('created', DateTime(), server_default=func.timezone('utc', func.now()), index=True),
+    Column('roles_id', Integer, ForeignKey('roles.id', ondelete='RESTRICT'), index=True),
+    # Row version, incremented on every update; used as the ETag of the resource
+    Column('version', Integer, server_default='1', nullable=False),
 )
 
 role = Table(
@@ -30,16 +34,107 @@ role = Table(
 
     Column('id', Integer, primary_key=True),
     Column('role', Enum('user', 'admin', name='role_types'), default='user', nullable=False,),
+    Column('version', Integer, server_default='1', nullable=False),
+)
+
+# Shared login rate limit buckets; UNLOGGED: no WAL, contents may be lost on crash
+login_bucket = Table(
+    'login_buckets', meta,
+
+    Column('key', String(200), primary_key=True),
+    Column('tokens', Float, nullable=False),
+    Column('updated', DateTime(timezone=True), server_default=func.now(), nullable=False, index=True),
+    prefixes=['UNLOGGED'],
 )
 
+# Issued refresh tokens; every login starts a family, every refresh replaces its token within the family
+refresh_token = Table(
+    'refresh_tokens', meta,
+
+    Column('jti', String(32), primary_key=True),
+    Column('family', String(32), nullable=False, index=True),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True),
+    Column('expires', DateTime(timezone=True), nullable=False, index=True),
+    Column('used', Boolean, server_default=false(), nullable=False),
+    Column('revoked_at', DateTime(timezone=True), nullable=True, index=True),
+)
+
+# Server-side HTTP sessions (session.backend = postgres); UNLOGGED like login_buckets
+http_session = Table(
+    'http_sessions', meta,
+
+    Column('key', String(32), primary_key=True),
+    Column('data', Text, nullable=False),
+    Column('expires', DateTime(timezone=True), nullable=False, index=True),
+    prefixes=['UNLOGGED'],
+)
+
+
+def engine_options(conf: dict, is_async: bool = True) -> dict:
+    """ Параметры движка и пула соединений из секции postgres конфигурации """
+
+    options = {
+        'echo': get_option(conf, 'echo', False, bool),
+        'pool_size': get_option(conf, 'pool_size', 5, int),
+        'max_overflow': get_option(conf, 'max_overflow', 10, int),
+        'pool_timeout': get_option(conf, 'pool_timeout', 30.0, float),
+        'pool_pre_ping': get_option(conf, 'pool_pre_ping', False, bool),
+        'pool_recycle': get_option(conf, 'pool_recycle', -1, int),
+    }
+    if is_async:
+        cache_size: int = get_option(conf, 'statement_cache_size', 100, int)
+        options['connect_args'] = {
+            # The SQLAlchemy adapter prepares statements itself and keeps them in this LRU
+            'prepared_statement_cache_size': cache_size,
+            # asyncpg's own cache is bypassed by the adapter; sized the same so 0 disables both
+            'statement_cache_size': cache_size,
+        }
+    return options
+
+
+def pool_stats(engine: AsyncEngine) -> dict[str, int]:
+    """ Текущее состояние пула соединений """
+
+    pool = engine.pool
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+    }
+
+
+def replica_hosts(conf: dict | None, default_port: int) -> list[tuple[str, int]]:
+    """ Адреса реплик из строки вида 'host1:5433,host2' """
+
+    hosts: list[tuple[str, int]] = []
+    for item in str(get_option(conf, 'hosts', '')).split(','):
+        item = item.strip()
+        if item:
+            host, _, port = item.partition(':')
+            hosts.append((host, int(port or default_port)))
+    return hosts
+
+
+def all_engines(app) -> list[AsyncEngine]:
+    """ Основной движок и движки реплик (для регистрации обработчиков событий) """
+
+    return [app['db'], *app.get('db_replicas', [])]
+
 
 async def pg_context(app):
     conf = app['config']['postgres']
     db_url = DSN.format(**conf)
-    engine = create_async_engine(db_url, echo=True,)
+    engine = create_async_engine(db_url, **engine_options(conf))
     app['db'] = engine
+    # Replicas share credentials and pool settings with the primary
+    app['db_replicas'] = [
+        create_async_engine(DSN.format(**{**conf, 'host': host, 'port': port}), **engine_options(conf))
+        for host, port in replica_hosts(app['config'].get('postgres_replicas'), int(conf['port']))
+    ]
 
     yield
 
-    app['db'].close()
-    await app['db'].wait_closed()
+    for replica in app['db_replicas']:
+        await replica.dispose()
+    await app['db'].dispose()
@@ -0,0 +1,33 @@
+from sqlalchemy import CursorResult, func, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from dao.database.schemas import login_bucket
+
+
+class LoginBucketDAO:
+
+    def __init__(self, connection: AsyncConnection):
+        self._connection = connection
+
+    async def take(self, key: str, rate: float, capacity: float) -> float:
+        """ Атомарно пополняет корзину и забирает один токен; возвращает остаток (отрицательный - отказ) """
+
+        elapsed = func.extract('epoch', func.now() - login_bucket.c.updated)
+        refilled = func.least(capacity, login_bucket.c.tokens + elapsed * rate)
+        statement = insert(login_bucket).values(key=key, tokens=capacity - 1, updated=func.now())
+        result: CursorResult = await self._connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=[login_bucket.c.key],
+                # Denied attempts drain the bucket too, down to -1
+                set_={'tokens': func.greatest(refilled - 1, literal(-1.0)), 'updated': func.now()},
+            ).returning(login_bucket.c.tokens)
+        )
+        return float(result.scalar())
+
+    async def delete_idle(self, seconds: float) -> None:
+        await self._connection.execute(
+            login_bucket.delete().where(
+                login_bucket.c.updated < func.now() - func.make_interval(0, 0, 0, 0, 0, 0, seconds)
+            )
+        )
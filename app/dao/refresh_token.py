@@ -0,0 +1,68 @@
+from datetime import datetime
+from typing import Sequence
+
+from sqlalchemy import CursorResult, Row, select, func, and_
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from dao.database.schemas import refresh_token
+
+TOKENS_CHANNEL = 'tokens_revoked'
+
+
+class RefreshTokenDAO:
+
+    def __init__(self, connection: AsyncConnection):
+        self._connection = connection
+
+    async def create(self, jti: str, family: str, user_id: int, expires: datetime) -> None:
+        await self._connection.execute(
+            refresh_token.insert().values(jti=jti, family=family, user_id=user_id, expires=expires)
+        )
+
+    async def use(self, jti: str) -> Row | None:
+        """ Помечает токен использованным; None, если он уже был использован, отозван или истёк """
+
+        result: CursorResult = await self._connection.execute(
+            refresh_token.update()
+            .where(
+                refresh_token.c.jti == jti,
+                refresh_token.c.used.is_(False),
+                refresh_token.c.revoked_at.is_(None),
+                refresh_token.c.expires > func.now(),
+            )
+            .values(used=True)
+            .returning(refresh_token.c.family, refresh_token.c.user_id)
+        )
+        return result.first()
+
+    async def get(self, jti: str) -> Row | None:
+        result: CursorResult = await self._connection.execute(
+            select(refresh_token.c.family, refresh_token.c.revoked_at).where(refresh_token.c.jti == jti)
+        )
+        return result.first()
+
+    async def revoke_family(self, family: str) -> None:
+        await self._connection.execute(
+            refresh_token.update()
+            .where(refresh_token.c.family == family, refresh_token.c.revoked_at.is_(None))
+            .values(revoked_at=func.now())
+        )
+        # NOTIFY is delivered to the workers after the transaction commits
+        await self._connection.execute(select(func.pg_notify(TOKENS_CHANNEL, family)))
+
+    async def get_revoked_since(self, seconds: float) -> Sequence[Row]:
+        """ Семейства, отозванные за последние seconds секунд, со временем отзыва (epoch) """
+
+        revoked_at = func.max(refresh_token.c.revoked_at)
+        result: CursorResult = await self._connection.execute(
+            select(refresh_token.c.family, func.extract('epoch', revoked_at).label('revoked_at'))
+            .where(and_(
+                refresh_token.c.revoked_at.is_not(None),
+                refresh_token.c.revoked_at > func.now() - func.make_interval(0, 0, 0, 0, 0, 0, seconds),
+            ))
+            .group_by(refresh_token.c.family)
+        )
+        return result.fetchall()
+
+    async def delete_expired(self) -> None:
+        await self._connection.execute(refresh_token.delete().where(refresh_token.c.expires < func.now()))
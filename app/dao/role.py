@@ -1,16 +1,24 @@
 from typing import Sequence
 
-from sqlalchemy import CursorResult, Row, exc
+from sqlalchemy import CursorResult, Row, exc, select, func
 from sqlalchemy.ext.asyncio import AsyncConnection
 
 from dao.database.schemas import role
 
+ROLES_CHANNEL = 'roles_changed'
+# NOTIFY payload besides a role id: roles were added, the role list changed
+LIST_CHANGED = 'all'
+
 
 class RoleDAO:
 
     def __init__(self, connection: AsyncConnection):
         self._connection = connection
 
+    @property
+    def on_replica(self) -> bool:
+        return self._connection.sync_connection.get_execution_options().get('replica', False)
+
     async def create(self, data: dict) -> Row[role] | None:
         try:
             if not data:
@@ -25,6 +33,12 @@ class RoleDAO:
 
         return result.first()
 
+    async def bulk_create(self, count: int, role_name: str = 'user') -> Sequence[int]:
+        result: CursorResult = await self._connection.execute(
+            role.insert().values([{'role': role_name}] * count).returning(role.c.id)
+        )
+        return result.scalars().all()
+
     async def get_all(self) -> Sequence[Row[role]]:
         result: CursorResult = await self._connection.execute(role.select())
         return result.fetchall()
@@ -35,11 +49,26 @@ class RoleDAO:
         )
         return result.first()
 
+    async def get_version(self, rid: int) -> int | None:
+        result: CursorResult = await self._connection.execute(
+            select(role.c.version).where(role.c.id == rid)
+        )
+        return result.scalar()
+
+    async def get_collection_version(self) -> Row:
+        """ Вставка меняет count и max(id), удаление - count, изменение - sum(version) """
+
+        result: CursorResult = await self._connection.execute(
+            select(func.count(role.c.id), func.max(role.c.id), func.sum(role.c.version))
+        )
+        return result.one()
+
     async def update(self, data: dict) -> Row[role] | bool:
         rid = data.pop('id')
         try:
             result: CursorResult = await self._connection.execute(
-                role.update().where(role.c.id == rid).values(**data).returning(role))
+                role.update().where(role.c.id == rid)
+                .values(**data, version=role.c.version + 1).returning(role))
         except exc.SQLAlchemyError:
             return False
 
@@ -50,3 +79,11 @@ class RoleDAO:
             role.delete().where(role.c.id == rid).returning(role)
         )
         return result.first()
+
+    async def delete_many(self, ids: Sequence[int]) -> None:
+        await self._connection.execute(role.delete().where(role.c.id.in_(ids)))
+
+    async def notify(self, payload: str) -> None:
+        """ NOTIFY доставляется слушателям после фиксации транзакции """
+
+        await self._connection.execute(select(func.pg_notify(ROLES_CHANNEL, payload)))
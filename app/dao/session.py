@@ -0,0 +1,33 @@
+from sqlalchemy import CursorResult, select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from dao.database.schemas import http_session
+
+
+class SessionDAO:
+
+    def __init__(self, connection: AsyncConnection):
+        self._connection = connection
+
+    async def get(self, key: str) -> str | None:
+        result: CursorResult = await self._connection.execute(
+            select(http_session.c.data).where(http_session.c.key == key, http_session.c.expires > func.now())
+        )
+        return result.scalar()
+
+    async def save(self, key: str, data: str, max_age: int) -> None:
+        expires = func.now() + func.make_interval(0, 0, 0, 0, 0, 0, max_age)
+        statement = insert(http_session).values(key=key, data=data, expires=expires)
+        await self._connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=[http_session.c.key],
+                set_={'data': statement.excluded.data, 'expires': statement.excluded.expires},
+            )
+        )
+
+    async def delete(self, key: str) -> None:
+        await self._connection.execute(http_session.delete().where(http_session.c.key == key))
+
+    async def delete_expired(self) -> None:
+        await self._connection.execute(http_session.delete().where(http_session.c.expires < func.now()))
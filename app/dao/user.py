@@ -1,9 +1,12 @@
-from typing import Sequence
+from datetime import datetime
+from typing import AsyncIterator, Sequence
 
-from sqlalchemy import CursorResult, Row, exc
-from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy import CursorResult, Row, exc, select, exists, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncResult
 
-from dao.database.schemas import user
+from dao.database.schemas import user, role
+from dao.role import ROLES_CHANNEL, LIST_CHANGED
 
 
 class UserDAO:
@@ -11,6 +14,10 @@ class UserDAO:
     def __init__(self, connection: AsyncConnection):
         self._connection = connection
 
+    @property
+    def on_replica(self) -> bool:
+        return self._connection.sync_connection.get_execution_options().get('replica', False)
+
     async def create(self, data: dict) -> Row[user] | None:
         try:
             result: CursorResult = await self._connection.execute(
@@ -25,23 +32,109 @@ class UserDAO:
         result: CursorResult = await self._connection.execute(user.select())
         return result.fetchall()
 
+    async def create_with_role(self, data: dict, role_name: str = 'user') -> Row | None:
+        """ Создаёт роль и пользователя одним запросом (CTE с INSERT) """
+
+        new_role = role.insert().values(role=role_name).returning(role.c.id, role.c.role).cte('new_role')
+        try:
+            result: CursorResult = await self._connection.execute(
+                user.insert()
+                .values(**data, roles_id=select(new_role.c.id).scalar_subquery())
+                .returning(
+                    *user.c,
+                    select(new_role.c.role).scalar_subquery().label('role'),
+                    # The new role changes the role list; NOTIFY is delivered to the workers on commit
+                    func.pg_notify(ROLES_CHANNEL, LIST_CHANGED).label('notified'),
+                )
+                .add_cte(new_role)
+            )
+        except exc.SQLAlchemyError:
+            return None
+
+        return result.first()
+
+    async def username_exists(self, username: str) -> bool:
+        result: CursorResult = await self._connection.execute(
+            select(exists().where(user.c.username == username))
+        )
+        return bool(result.scalar())
+
+    async def bulk_create(self, rows: list[dict]) -> Sequence[Row]:
+        """ Многострочный INSERT; строки с уже занятым username пропускаются """
+
+        result: CursorResult = await self._connection.execute(
+            insert(user).values(rows)
+            .on_conflict_do_nothing(index_elements=[user.c.username])
+            .returning(user.c.id, user.c.username)
+        )
+        return result.fetchall()
+
+    async def get_existing_usernames(self, usernames: Sequence[str]) -> set[str]:
+        result: CursorResult = await self._connection.execute(
+            select(user.c.username).where(user.c.username.in_(usernames))
+        )
+        return set(result.scalars().all())
+
+    async def get_page(self, limit: int, after: int | None = None) -> Sequence[Row[user]]:
+        query = user.select().order_by(user.c.id).limit(limit)
+        if after is not None:
+            query = query.where(user.c.id > after)
+        result: CursorResult = await self._connection.execute(query)
+        return result.fetchall()
+
+    async def stream_all(self, batch_size: int) -> AsyncIterator[Sequence[Row[user]]]:
+        result: AsyncResult = await self._connection.stream(
+            user.select().order_by(user.c.id).execution_options(yield_per=batch_size)
+        )
+        async for partition in result.partitions(batch_size):
+            yield partition
+
+    async def stream_with_roles(self, batch_size: int, since: datetime | None = None) -> AsyncIterator[Sequence[Row]]:
+        query = (
+            select(*[column for column in user.c if column.name != 'password'], role.c.role)
+            .join(role, user.c.roles_id == role.c.id)
+            .order_by(user.c.id)
+            .execution_options(yield_per=batch_size)
+        )
+        if since is not None:
+            query = query.where(user.c.created >= since)
+
+        result: AsyncResult = await self._connection.stream(query)
+        async for partition in result.partitions(batch_size):
+            yield partition
+
     async def get_by_id(self, uid: int) -> Row[user]:
         result: CursorResult = await self._connection.execute(
             user.select().where(user.c.id == uid)
         )
         return result.first()
 
+    async def get_version(self, uid: int) -> int | None:
+        result: CursorResult = await self._connection.execute(
+            select(user.c.version).where(user.c.id == uid)
+        )
+        return result.scalar()
+
     async def get_by_username(self, username: str) -> Row[user]:
         result: CursorResult = await self._connection.execute(
             user.select().where(user.c.username == username)
         )
         return result.first()
 
+    async def get_by_username_with_role(self, username: str) -> Row | None:
+        result: CursorResult = await self._connection.execute(
+            select(user, role.c.role)
+            .join(role, user.c.roles_id == role.c.id)
+            .where(user.c.username == username)
+        )
+        return result.first()
+
     async def update(self, data: dict) -> Row[user] | bool:
         uid = data.pop('id')
         try:
             result: CursorResult = await self._connection.execute(
-                user.update().where(user.c.id == uid).values(**data).returning(user))
+                user.update().where(user.c.id == uid)
+                .values(**data, version=user.c.version + 1).returning(user))
         except exc.SQLAlchemyError:
             return False
 
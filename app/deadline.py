@@ -0,0 +1,109 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Callable, Awaitable
+
+from aiohttp import web
+from sqlalchemy import event, exc
+
+from dao.database.schemas import all_engines
+from settings import get_option
+
+_WebHandler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+QUERY_CANCELED = '57014'
+SET_STATEMENT_TIMEOUT = "SELECT set_config('statement_timeout', $1, true)"
+_NOT_SET = object()
+
+# Absolute deadline of the current request in event loop time
+_deadline: ContextVar[float | None] = ContextVar('deadline', default=None)
+
+
+def with_deadline(seconds: float | None) -> Callable[[_WebHandler], _WebHandler]:
+    """ Декоратор, задающий собственный срок обработки запроса (None - без ограничения) """
+
+    def decorator(func: _WebHandler) -> _WebHandler:
+        func.__deadline__ = seconds
+        return func
+
+    return decorator
+
+
+def clear_deadline(request: web.Request) -> None:
+    """ Снимает ограничение для длительных потоковых ответов """
+
+    timeout: asyncio.Timeout | None = request.get('deadline')
+    if timeout is not None:
+        timeout.reschedule(None)
+    _deadline.set(None)
+
+
+def _is_query_canceled(error: exc.DBAPIError) -> bool:
+    return getattr(error.orig, 'sqlstate', None) == QUERY_CANCELED
+
+
+def deadline_middleware(default: float | None) -> Callable:
+
+    @web.middleware
+    async def enforce_deadline(request: web.Request, handler: _WebHandler) -> web.StreamResponse:
+        """ Срок обработки запроса: по истечении - 504, SQL-запросы ограничены оставшимся временем """
+
+        seconds: Any = getattr(request.match_info.handler, '__deadline__', _NOT_SET)
+        if seconds is _NOT_SET:
+            seconds = default
+        if seconds is None:
+            return await handler(request)
+
+        deadline: float = asyncio.get_running_loop().time() + seconds
+        token = _deadline.set(deadline)
+        timeout = asyncio.timeout_at(deadline)
+        try:
+            async with timeout:
+                request['deadline'] = timeout
+                return await handler(request)
+        except TimeoutError:
+            # Only the request deadline means 504; a TimeoutError of the handler's own is passed on
+            if not timeout.expired():
+                raise
+            raise web.HTTPGatewayTimeout()
+        except exc.DBAPIError as e:
+            if _is_query_canceled(e):
+                raise web.HTTPGatewayTimeout()
+            raise
+        finally:
+            _deadline.reset(token)
+
+    return enforce_deadline
+
+
+def _on_begin(conn) -> None:
+    conn.info['deadline_applied'] = False
+
+
+def _apply_statement_timeout(conn, cursor, statement, parameters, context, executemany) -> None:
+    deadline: float | None = _deadline.get()
+    if deadline is None or conn.info.get('deadline_applied', True):
+        return
+
+    conn.info['deadline_applied'] = True
+    remaining_ms = int((deadline - asyncio.get_running_loop().time()) * 1000)
+    # Same as SET LOCAL: lasts until the end of the transaction, so pooled connections are not affected.
+    # One constant statement text keeps a single prepared statement for every request
+    cursor.execute(SET_STATEMENT_TIMEOUT, (str(max(1, remaining_ms)),))
+
+
+async def deadline_context(app: web.Application):
+    engines = [engine.sync_engine for engine in all_engines(app)]
+    for engine in engines:
+        event.listen(engine, 'begin', _on_begin)
+        event.listen(engine, 'before_cursor_execute', _apply_statement_timeout)
+
+    yield
+
+    for engine in engines:
+        event.remove(engine, 'begin', _on_begin)
+        event.remove(engine, 'before_cursor_execute', _apply_statement_timeout)
+
+
+def setup_deadline(application: web.Application) -> None:
+    options: dict = application['config']['common']
+    application.middlewares.append(deadline_middleware(get_option(options, 'request_timeout', 30.0, float)))
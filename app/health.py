@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import signal
+import time
+
+from aiohttp import web
+from sqlalchemy import exc, text
+
+from dao.database.schemas import engine_options, pool_stats
+from metrics import REGISTRY, Gauge
+from services.listener import listeners
+from settings import get_option
+from views.serializers import json_response
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = 0.5
+
+EVENT_LOOP_LAG = REGISTRY.register(Gauge(
+    'event_loop_lag_seconds', 'Delay of a periodic event loop callback behind its schedule.'))
+
+
+class HealthMonitor:
+    """ Состояние для /readyz: кэшированная проверка БД, задержка event loop и признак остановки """
+
+    def __init__(self, app: web.Application):
+        options: dict = app['config'].get('health', {})
+        self._app = app
+        self._ping_interval: float = get_option(options, 'ping_interval', 1.0, float)
+        self._ping_timeout: float = get_option(options, 'ping_timeout', 1.0, float)
+        self._max_loop_lag: float | None = get_option(options, 'max_loop_lag', None, float)
+        self._max_hashing_queue: int | None = get_option(options, 'max_hashing_queue', None, int)
+        self.drain_delay: float = get_option(options, 'drain_delay', 0.0, float)
+        conf: dict = engine_options(app['config']['postgres'])
+        self._pool_capacity: int = conf['pool_size'] + max(conf['max_overflow'], 0)
+
+        self.shutting_down = False
+        self.draining: asyncio.Task | None = None
+        self.loop_lag = 0.0
+        self._db_ok = False
+        self._db_error: str | None = None
+        self._db_checked: float | None = None
+        self._ping_lock = asyncio.Lock()
+
+    async def measure_loop_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag = max(0.0, loop.time() - expected)
+
+    async def drain(self) -> None:
+        """ Перевод в not-ready, пауза drain_delay с открытым listener, затем остановка сервера """
+
+        self.shutting_down = True
+        if self.drain_delay:
+            # The balancer sees not-ready while new and keep-alive connections are still accepted and served
+            await asyncio.sleep(self.drain_delay)
+        raise web.GracefulExit()
+
+    def _pool(self) -> dict[str, int | float]:
+        stats: dict = pool_stats(self._app['db'])
+        stats['capacity'] = self._pool_capacity
+        stats['saturation'] = round(stats['checked_out'] / self._pool_capacity, 3) if self._pool_capacity else 0.0
+        return stats
+
+    async def _ping(self, pool: dict) -> None:
+        # At most one ping per interval, whatever the probe rate; concurrent probes wait for it
+        async with self._ping_lock:
+            now = time.monotonic()
+            if self._db_checked is not None and now - self._db_checked < self._ping_interval:
+                return
+            # Every connection is busy, so the database is evidently serving; waiting for one would only time out
+            if pool['checked_out'] >= self._pool_capacity:
+                return
+
+            try:
+                async with asyncio.timeout(self._ping_timeout):
+                    async with self._app['db'].connect() as connection:
+                        await connection.execute(text('SELECT 1'))
+                self._db_ok, self._db_error = True, None
+            except (OSError, asyncio.TimeoutError, exc.SQLAlchemyError) as e:
+                if self._db_ok:
+                    logger.warning('Database ping failed: %s', e)
+                self._db_ok, self._db_error = False, str(e) or type(e).__name__
+            self._db_checked = time.monotonic()
+
+    async def readiness(self) -> tuple[bool, dict]:
+        pool: dict = self._pool()
+        if not self.shutting_down:
+            await self._ping(pool)
+
+        hashing_queue: int = self._app['hashing'].queue_depth if 'hashing' in self._app else 0
+        checks = {
+            'shutting_down': self.shutting_down,
+            'db': {
+                'ok': self._db_ok,
+                'checked_ago': None if self._db_checked is None else round(time.monotonic() - self._db_checked, 3),
+                'error': self._db_error,
+            },
+            'pool': pool,
+            'event_loop_lag': round(self.loop_lag, 4),
+            'hashing_queue_depth': hashing_queue,
+            'listeners': {channel: listener.connected for channel, listener in listeners.items()},
+        }
+        if 'db_router' in self._app:
+            checks['replicas'] = self._app['db_router'].replicas()
+
+        # Without its LISTEN connection the worker misses token revocations and role changes of other workers
+        ready = not self.shutting_down and self._db_ok and all(checks['listeners'].values())
+        if self._max_loop_lag is not None and self.loop_lag > self._max_loop_lag:
+            ready = False
+        if self._max_hashing_queue is not None and hashing_queue > self._max_hashing_queue:
+            ready = False
+        return ready, checks
+
+
+async def healthz(request: web.Request) -> web.Response:
+    """
+    ---
+    description: Liveness probe. Answers while the process is running, performs no I/O.
+    tags:
+    - Status
+    produces:
+    - application/json
+    responses:
+        "200":
+            description: Process is alive
+    """
+    return json_response(data={'status': 'OK'}, status=200)
+
+
+async def readyz(request: web.Request) -> web.Response:
+    """
+    ---
+    description: Readiness probe. Checks the database (cached ping) and the LISTEN connections, reports
+        pool saturation, event loop lag and hashing pool queue depth. Not ready while the worker shuts down.
+    tags:
+    - Status
+    produces:
+    - application/json
+    responses:
+        "200":
+            description: Ready to serve traffic
+        "503":
+            description: Not ready
+    """
+    ready, checks = await request.app['health'].readiness()
+    return json_response(data={'status': 'ready' if ready else 'not_ready', **checks}, status=200 if ready else 503)
+
+
+@REGISTRY.collector
+def _collect_loop_lag(app: web.Application) -> None:
+    if 'health' in app:
+        EVENT_LOOP_LAG.set(value=app['health'].loop_lag)
+
+
+async def _on_shutdown(app: web.Application) -> None:
+    # Exit without draining (SIGINT): the sites are already closed
+    app['health'].shutting_down = True
+
+
+async def health_context(app: web.Application):
+    monitor = HealthMonitor(app)
+    app['health'] = monitor
+    task = asyncio.create_task(monitor.measure_loop_lag())
+
+    # web.run_app closes the listening socket on SIGTERM before on_shutdown runs, so a drain pause there
+    # would refuse the probes it is meant to answer; the worker replaces that handler with its own
+    loop = asyncio.get_running_loop()
+
+    def on_sigterm() -> None:
+        if monitor.draining is None:
+            monitor.draining = loop.create_task(monitor.drain())
+
+    loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+
+    yield
+
+    loop.remove_signal_handler(signal.SIGTERM)
+    if monitor.draining is not None and monitor.draining.done() and not monitor.draining.cancelled():
+        # The GracefulExit that stopped the server; retrieved so it is not logged as lost
+        monitor.draining.exception()
+    # Cleanup contexts exit in reverse order: this runs before pg_context disposes the engine
+    monitor.shutting_down = True
+    task.cancel()
+
+
+def setup_health(application: web.Application) -> None:
+    """ Регистрировать сразу после pg_context: движок должен закрываться после перехода в not-ready """
+
+    application.cleanup_ctx.append(health_context)
+    application.on_shutdown.append(_on_shutdown)
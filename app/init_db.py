@@ -1,9 +1,9 @@
 import base64
 import hashlib
 
-from sqlalchemy import create_engine, MetaData, CursorResult, Row, exc
+from sqlalchemy import create_engine, MetaData, CursorResult, Row, exc, text
 
-from dao.database.schemas import user, role
+from dao.database.schemas import user, role, login_bucket, refresh_token, http_session, engine_options
 from settings import config
 
 DSN = 'postgresql://{user}:{password}@{host}:{port}/{database}'
@@ -25,7 +25,35 @@ def _encode_password(password: str) -> str:
 
 def create_tables(engine):
     meta = MetaData()
-    meta.create_all(bind=engine, tables=[user, role])
+    meta.create_all(bind=engine, tables=[user, role, login_bucket, refresh_token, http_session])
+
+
+def apply_migrations(engine):
+    """ Приводит уже существующие таблицы к текущей схеме (идемпотентно) """
+
+    # CREATE INDEX CONCURRENTLY не может выполняться внутри транзакции
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text("ALTER TABLE users ALTER COLUMN created SET DEFAULT timezone('utc', now())"))
+        for table in (user, role):
+            connection.execute(text(
+                f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1'
+            ))
+
+        for table in (user, role):
+            for index in table.indexes:
+                # Прерванное построение оставляет невалидный индекс, который IF NOT EXISTS пропустил бы
+                is_valid = connection.execute(text(
+                    'SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+                    'WHERE c.relname = :name'
+                ), {'name': index.name}).scalar()
+                if is_valid is False:
+                    connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {index.name}'))
+
+                columns = ', '.join(column.name for column in index.columns)
+                unique = 'UNIQUE ' if index.unique else ''
+                connection.execute(text(
+                    f'CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {table.name} ({columns})'
+                ))
 
 
 def create_admin(engine):
@@ -50,9 +78,11 @@ def create_admin(engine):
 
 if __name__ == '__main__':
     db_url = DSN.format(**config['postgres'])
-    engine = create_engine(db_url, echo=True)
+    engine = create_engine(db_url, **engine_options(config['postgres'], is_async=False))
 
     # Создает таблицы в БД
     create_tables(engine)
+    # Добавляет индексы и значения по умолчанию в существующие таблицы
+    apply_migrations(engine)
     # Создает пользователя с админскими правами
     create_admin(engine)
@@ -1,12 +1,20 @@
 from aiohttp import web
-import aiohttp_session
-from aiohttp_session.cookie_storage import EncryptedCookieStorage
-from cryptography import fernet
-import base64
 
 from dao.database.schemas import pg_context
-from middlewares import check_auth, check_admin, check_owner_or_admin
-from settings import config
+from services.hashing import hashing_context
+from services.role import role_cache_context
+from services.ratelimit import login_throttle_context
+from services.token import revocation_context
+from admission import setup_admission
+from deadline import setup_deadline, deadline_context
+from health import setup_health
+from metrics import collect_metrics, metrics_context
+from querylog import setup_querylog
+from replicas import replicas_context, track_writes
+from middlewares import authorize
+from server import run_workers
+from sessions import setup_session
+from settings import config, get_option
 from routes import setup_routes
 
 
@@ -14,23 +22,37 @@ def setup_config(application: web.Application) -> None:
     application['config'] = config
 
 
-def setup_session(application: web.Application) -> None:
-    fernet_key: bytes = fernet.Fernet.generate_key()
-    secret_key: bytes = base64.urlsafe_b64decode(fernet_key)
-    aiohttp_session.setup(application, EncryptedCookieStorage(secret_key))
-
-
 def setup_app(application: web.Application) -> web.Application:
     setup_config(application)
     setup_routes(application)
     application.cleanup_ctx.append(pg_context)
+    application.cleanup_ctx.append(replicas_context)
+    setup_health(application)
+    application.cleanup_ctx.append(metrics_context)
+    application.cleanup_ctx.append(deadline_context)
+    application.cleanup_ctx.append(hashing_context)
+    application.cleanup_ctx.append(role_cache_context)
+    application.cleanup_ctx.append(revocation_context)
+    application.cleanup_ctx.append(login_throttle_context)
     setup_session(application)
-    application.middlewares.append(check_auth)
-    application.middlewares.append(check_admin)
-    application.middlewares.append(check_owner_or_admin)
+    application.middlewares.append(collect_metrics)
+    setup_querylog(application)
+    setup_admission(application)
+    setup_deadline(application)
+    application.middlewares.append(track_writes)
+    application.middlewares.append(authorize)
     return application
 
 
+def create_app() -> web.Application:
+    return setup_app(web.Application())
+
+
 if __name__ == '__main__':
-    app = web.Application()
-    web.run_app(setup_app(app))
+    options: dict = config['common']
+    run_workers(
+        create_app,
+        workers=get_option(options, 'workers', 1, int),
+        port=get_option(options, 'port', 8080, int),
+        reuse_port=get_option(options, 'reuse_port', False, bool),
+    )
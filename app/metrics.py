@@ -0,0 +1,273 @@
+import abc
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Awaitable, Sequence
+
+from aiohttp import web
+from sqlalchemy import event
+
+from dao.database.schemas import pool_stats, all_engines
+from services.cache import TTLCache
+
+_WebHandler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric(abc.ABC):
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def header(self) -> list[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    @abc.abstractmethod
+    def render(self) -> list[str]:
+        ...
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values: Any, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def set_total(self, *label_values: Any, value: float) -> None:
+        """ Для счётчиков, которые ведутся вне реестра (например, в кэшах) """
+
+        self._values[label_values] = value
+
+    def render(self) -> list[str]:
+        return [f'{self.name}{_format_labels(self.labels, key)} {value}' for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    set = Counter.set_total
+
+    def dec(self, *label_values: Any, amount: float = 1.0) -> None:
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self._buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., sum, count]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, *label_values: Any, value: float) -> None:
+        state = self._values.get(label_values)
+        if state is None:
+            state = self._values[label_values] = [0] * len(self._buckets) + [0.0, 0]
+        for i, bound in enumerate(self._buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self._buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {state[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {state[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {state[-1]}')
+        return lines
+
+
+class Registry:
+    """ Реестр метрик процесса; отдаётся в текстовом формате Prometheus """
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[web.Application], None]] = []
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func: Callable[[web.Application], None]) -> Callable[[web.Application], None]:
+        """ Функция, обновляющая gauge-метрики непосредственно перед выдачей """
+
+        self._collectors.append(func)
+        return func
+
+    def render(self, app: web.Application) -> str:
+        for collect in self._collectors:
+            collect(app)
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'http_requests_total', 'Total HTTP requests.', ('route', 'method', 'status')))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency.', ('route', 'method')))
+REQUEST_DB_SECONDS = REGISTRY.register(Histogram(
+    'http_request_db_seconds', 'Time spent in SQL statements per HTTP request.', ('route',)))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'http_requests_in_flight', 'HTTP requests currently being handled.'))
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    'db_query_duration_seconds', 'SQL statement execution time.', ('route',)))
+PBKDF2_SECONDS = REGISTRY.register(Histogram(
+    'pbkdf2_duration_seconds', 'PBKDF2 derivation time (excluding queue wait).'))
+JWT_DECODE_SECONDS = REGISTRY.register(Histogram(
+    'jwt_decode_duration_seconds', 'JWT signature verification time.',
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)))
+DB_POOL = REGISTRY.register(Gauge(
+    'db_pool_connections', 'Connection pool state.', ('state',)))
+HASHING_POOL = REGISTRY.register(Gauge(
+    'hashing_pool_tasks', 'Hashing pool tasks.', ('state',)))
+CACHE = REGISTRY.register(Counter(
+    'cache_lookups_total', 'In-process cache lookups.', ('cache', 'result')))
+SINGLEFLIGHT_CALLS = REGISTRY.register(Counter(
+    'singleflight_calls_total', 'Coalesced lookups: executed, merged into an in-flight one or bypassed.',
+    ('name', 'result')))
+
+
+class _RequestStats:
+    __slots__ = ('route', 'db_seconds')
+
+    def __init__(self, route: str):
+        self.route = route
+        self.db_seconds = 0.0
+
+
+_request_stats: ContextVar[_RequestStats | None] = ContextVar('request_stats', default=None)
+
+
+def current_route() -> str | None:
+    """ Имя маршрута обрабатываемого запроса (для журналов SQL) """
+
+    stats: _RequestStats | None = _request_stats.get()
+    return stats.route if stats else None
+
+
+def _route_name(request: web.Request) -> str:
+    # Route names keep label cardinality bounded, unlike raw paths
+    return request.match_info.route.name or 'unnamed'
+
+
+@web.middleware
+async def collect_metrics(request: web.Request, handler: _WebHandler) -> web.StreamResponse:
+    """ Счётчики, время обработки и время SQL по имени маршрута """
+
+    stats = _RequestStats(_route_name(request))
+    token = _request_stats.set(stats)
+    IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        IN_FLIGHT.dec()
+        REQUEST_SECONDS.observe(stats.route, request.method, value=time.perf_counter() - started)
+        REQUEST_DB_SECONDS.observe(stats.route, value=stats.db_seconds)
+        REQUESTS.inc(stats.route, request.method, status)
+        _request_stats.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context.metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - context.metrics_started
+    stats: _RequestStats | None = _request_stats.get()
+    if stats is not None:
+        stats.db_seconds += elapsed
+    DB_QUERY_SECONDS.observe(stats.route if stats else 'background', value=elapsed)
+
+
+@REGISTRY.collector
+def _collect_pools(app: web.Application) -> None:
+    if 'db' in app:
+        for state, value in pool_stats(app['db']).items():
+            DB_POOL.set(state, value=value)
+    if 'hashing' in app:
+        stats: dict = app['hashing'].stats()
+        HASHING_POOL.set('queued', value=stats['queue_depth'])
+        HASHING_POOL.set('running', value=stats['running'])
+
+
+@REGISTRY.collector
+def _collect_caches(app: web.Application) -> None:
+    # Imported here: both modules import this one to record their own timings
+    from middlewares import token_cache
+    from services.role import role_cache
+
+    caches: dict[str, TTLCache] = {'roles': role_cache, 'tokens': token_cache}
+    for name, cache in caches.items():
+        CACHE.set_total(name, 'hit', value=cache.hits)
+        CACHE.set_total(name, 'miss', value=cache.misses)
+
+
+async def metrics_context(app: web.Application):
+    engines = [engine.sync_engine for engine in all_engines(app)]
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    yield
+
+    for engine in engines:
+        event.remove(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    """
+    ---
+    description: Prometheus metrics of this worker process.
+    tags:
+    - Status
+    produces:
+    - text/plain
+    responses:
+        "200":
+            description: Successful operation
+    """
+    return web.Response(
+        text=REGISTRY.render(request.app),
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+    )
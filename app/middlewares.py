@@ -1,14 +1,32 @@
-from typing import Callable, Awaitable
+import hashlib
+import time
+from typing import Any, Callable, Awaitable
 
-import aiohttp_session
 from aiohttp import web
 import jwt
 
-from settings import config
+from metrics import JWT_DECODE_SECONDS
+from services.cache import TTLCache, MISSING
+from services.auth import REFRESH
+from services.token import revocation_index
+from settings import config, get_option
 
 _WebHandler = Callable[[web.Request], Awaitable[web.StreamResponse]]
 OPTIONS = config['jwt']
 
+POLICY_PUBLIC = 'public'
+POLICY_AUTH = 'auth'
+POLICY_ADMIN = 'admin'
+POLICY_OWNER_OR_ADMIN = 'owner_or_admin'
+
+_policies: dict[Any, str] = {}
+
+_cache_options: dict = config.get('cache', {})
+token_cache = TTLCache(
+    maxsize=get_option(_cache_options, 'token_maxsize', 10000, int),
+    ttl=get_option(_cache_options, 'token_ttl', 300.0, float),
+)
+
 
 def auth_required(func: _WebHandler) -> _WebHandler:
     """ Декоратор, указывающий на необходимость аутентификации """
@@ -33,65 +51,103 @@ def owner_or_admin_required(func: _WebHandler) -> _WebHandler:
     return func
 
 
-@web.middleware
-async def check_auth(request: web.Request, handler: _WebHandler) -> web.StreamResponse:
-    """ Функция проверки наличия JWT аутентификации """
-
-    is_required: bool = getattr(handler, '__auth_required__', False)
-    if is_required:
-        session = await aiohttp_session.get_session(request)
-        if not request.headers.get('Authorization'):
-            raise web.HTTPUnauthorized()
-
-        token: str = request.headers.get('Authorization')
-        if token.startswith('Bearer'):
-            token = token.split('Bearer ')[-1]
-        try:
-            user: dict[str, str] = jwt.decode(jwt=token, key=OPTIONS['secret'], algorithms=[OPTIONS['algorithm']])
-            session['user_id'] = int(user.get('id'))
-            session['user_role'] = user.get('role', 'user')
-        except jwt.exceptions.PyJWTError:
-            raise web.HTTPUnauthorized
+def _resolve_policy(handler: Any) -> str:
+    """ Определяет политику доступа обработчика (результат кэшируется) """
 
-    return await handler(request)
+    policy: str | None = _policies.get(handler)
+    if policy is None:
+        if getattr(handler, '__admin_required__', False):
+            policy = POLICY_ADMIN
+        elif getattr(handler, '__owner_or_admin_required__', False):
+            policy = POLICY_OWNER_OR_ADMIN
+        elif getattr(handler, '__auth_required__', False):
+            policy = POLICY_AUTH
+        else:
+            policy = POLICY_PUBLIC
+        _policies[handler] = policy
+    return policy
 
 
-@web.middleware
-async def check_admin(request: web.Request, handler: _WebHandler) -> web.StreamResponse:
-    """ Функция проверки наличия прав администратора """
-
-    is_required: bool = getattr(handler, '__admin_required__', False)
-    if is_required:
-        session = await aiohttp_session.get_session(request)
-        try:
-            user_role: str = session['user_role']
-        except Exception:
-            raise web.HTTPUnauthorized
-
-        if user_role != 'admin':
-            raise web.HTTPForbidden
+def _decode_bearer(request: web.Request) -> dict[str, Any]:
+    """ Функция проверки наличия JWT аутентификации """
 
-    return await handler(request)
+    token: str | None = request.headers.get('Authorization')
+    if not token:
+        raise web.HTTPUnauthorized()
+
+    if token.startswith('Bearer'):
+        token = token.split('Bearer ')[-1]
+
+    key: bytes = hashlib.sha256(token.encode('utf-8')).digest()
+    cached: dict[str, Any] = token_cache.get(key)
+    # The TTL never outlives exp, the check below guards against clock adjustments
+    if cached is not MISSING and cached.get('exp', float('inf')) > time.time():
+        return dict(cached)
+
+    started = time.perf_counter()
+    try:
+        claims: dict[str, Any] = jwt.decode(jwt=token, key=OPTIONS['secret'], algorithms=[OPTIONS['algorithm']])
+        claims['id'] = int(claims['id'])
+    except (jwt.exceptions.PyJWTError, KeyError, TypeError, ValueError):
+        raise web.HTTPUnauthorized
+    finally:
+        JWT_DECODE_SECONDS.observe(value=time.perf_counter() - started)
+
+    ttl: float | None = None
+    if 'exp' in claims:
+        ttl = min(float(claims['exp']) - time.time(), token_cache.ttl)
+    if ttl is None or ttl > 0:
+        token_cache.set(key, dict(claims), ttl)
+    return claims
+
+
+def logout_claims(request: web.Request) -> dict[str, Any] | None:
+    """ Claims bearer-токена для выхода: истёкший токен принимается, недействительный - игнорируется """
+
+    token: str | None = request.headers.get('Authorization')
+    if not token:
+        return None
+    if token.startswith('Bearer'):
+        token = token.split('Bearer ')[-1]
+
+    # The signature is still checked: only the family of a token we issued is revoked
+    try:
+        claims: dict[str, Any] = jwt.decode(
+            jwt=token, key=OPTIONS['secret'], algorithms=[OPTIONS['algorithm']], options={'verify_exp': False}
+        )
+    except jwt.exceptions.PyJWTError:
+        return None
+    return None if claims.get('typ') == REFRESH else claims
+
+
+def _verify_access(claims: dict[str, Any]) -> dict[str, Any]:
+    # Refresh tokens are not accepted as bearer tokens; revoked families are checked in memory
+    if claims.get('typ') == REFRESH or revocation_index.is_revoked(claims.get('fam')):
+        raise web.HTTPUnauthorized
+    return claims
 
 
 @web.middleware
-async def check_owner_or_admin(request: web.Request, handler: _WebHandler) -> web.StreamResponse:
-    """ Функция проверки наличия прав владельца или администратора """
+async def authorize(request: web.Request, handler: _WebHandler) -> web.StreamResponse:
+    """ Проверка аутентификации и прав доступа: политика и JWT разбираются один раз за запрос """
 
-    is_required: bool = getattr(handler, '__owner_or_admin_required__', False)
-    if is_required:
-        session = await aiohttp_session.get_session(request)
-        requested_id = int(request.match_info['uid'])
+    policy: str = _resolve_policy(request.match_info.handler)
+    if policy == POLICY_PUBLIC:
+        return await handler(request)
 
-        try:
-            user_id: int = session['user_id']
-            user_role: str = session['user_role']
-        except Exception:
-            raise web.HTTPUnauthorized
+    claims: dict[str, Any] = _verify_access(_decode_bearer(request))
+    user_id: int = claims['id']
+    user_role: str = claims.get('role', 'user')
+    request['claims'] = claims
+    request['user_id'] = user_id
+    request['user_role'] = user_role
 
-        if True in [user_role == 'admin', requested_id == user_id]:
-            return await handler(request)
-        else:
+    if policy == POLICY_ADMIN and user_role != 'admin':
+        raise web.HTTPForbidden
+
+    if policy == POLICY_OWNER_OR_ADMIN:
+        requested_id = int(request.match_info['uid'])
+        if user_role != 'admin' and requested_id != user_id:
             raise web.HTTPForbidden
 
     return await handler(request)
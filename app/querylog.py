@@ -0,0 +1,110 @@
+import collections
+import logging
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Callable, Awaitable
+
+from aiohttp import web
+from sqlalchemy import event
+
+from dao.database.schemas import all_engines
+from metrics import current_route
+from settings import get_option
+
+logger = logging.getLogger('sql.slow')
+
+_WebHandler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+PROFILE_HEADER = 'X-SQL-Profile'
+RECENT_PROFILES = 50
+
+_profile: ContextVar[list[dict] | None] = ContextVar('sql_profile', default=None)
+
+
+def _param_shape(parameters: Any) -> Any:
+    """ Только типы параметров: значения (пароли, токены) в журнал не попадают """
+
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f'{len(parameters)} x {_param_shape(parameters[0])}'
+        types = [type(value).__name__ for value in parameters]
+        # Multi-row VALUES produce hundreds of parameters
+        return types if len(types) <= 8 else f'{len(types)} params of {sorted(set(types))}'
+    return type(parameters).__name__
+
+
+class QueryLog:
+    """ Журнал медленных запросов и профиль SQL отдельного HTTP-запроса """
+
+    def __init__(self, config: dict[str, dict]):
+        self._slow_ms: float = get_option(config['postgres'], 'slow_query_ms', 200.0, float)
+        self.profiling: bool = get_option(config['common'], 'sql_profile', False, bool)
+        self.recent: collections.deque[dict] = collections.deque(maxlen=RECENT_PROFILES)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        context.querylog_started = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed_ms = (time.perf_counter() - context.querylog_started) * 1000
+        profile: list[dict] | None = _profile.get()
+        if profile is not None:
+            profile.append({'sql': statement, 'ms': round(elapsed_ms, 3), 'rows': cursor.rowcount})
+
+        if elapsed_ms >= self._slow_ms:
+            logger.warning(
+                'Slow query %.1f ms, route=%s, rows=%s, params=%s: %s',
+                elapsed_ms, current_route(), cursor.rowcount, _param_shape(parameters), statement,
+            )
+
+
+@web.middleware
+async def profile_sql(request: web.Request, handler: _WebHandler) -> web.StreamResponse:
+    """ По заголовку X-SQL-Profile собирает SQL-запросы, выполненные при обработке запроса """
+
+    querylog: QueryLog = request.app['querylog']
+    if not querylog.profiling or not request.headers.get(PROFILE_HEADER):
+        return await handler(request)
+
+    profile: list[dict] = []
+    token = _profile.set(profile)
+    request_id = uuid.uuid4().hex
+    try:
+        response = await handler(request)
+    finally:
+        _profile.reset(token)
+        querylog.recent.append({
+            'request_id': request_id,
+            'route': request.match_info.route.name,
+            'method': request.method,
+            'path': request.path,
+            'queries': profile,
+        })
+
+    if not response.prepared:
+        total_ms = sum(query['ms'] for query in profile)
+        response.headers['X-Request-Id'] = request_id
+        response.headers['Server-Timing'] = f'db;dur={total_ms:.3f};desc="{len(profile)} queries"'
+    return response
+
+
+async def querylog_context(app: web.Application):
+    querylog: QueryLog = app['querylog']
+    engines = [engine.sync_engine for engine in all_engines(app)]
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', querylog.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', querylog.after_cursor_execute)
+
+    yield
+
+    for engine in engines:
+        event.remove(engine, 'before_cursor_execute', querylog.before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', querylog.after_cursor_execute)
+
+
+def setup_querylog(application: web.Application) -> None:
+    application['querylog'] = QueryLog(application['config'])
+    application.cleanup_ctx.append(querylog_context)
+    application.middlewares.append(profile_sql)
@@ -0,0 +1,199 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Awaitable
+
+from aiohttp import web
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from metrics import REGISTRY, Counter, Gauge
+from services.cache import TTLCache, MISSING
+from settings import get_option
+
+logger = logging.getLogger(__name__)
+
+_WebHandler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+# Replay lag in seconds; 0 when everything received has been replayed (an idle replica is not lagging)
+LAG_QUERY = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Time of the client's last successful write (epoch seconds)
+LAST_WRITE_COOKIE = 'last_write'
+# Login and token refresh write nothing the client reads back
+LOGIN_ROUTE = 'user_auth'
+
+DB_READS = REGISTRY.register(Counter(
+    'db_reads_total', 'Read connections by target: replica, primary or fallback after a replica failure.',
+    ('target',)))
+DB_REPLICA_UP = REGISTRY.register(Gauge(
+    'db_replica_up', 'Replica passed the last health check.', ('replica',)))
+
+
+class _Replica:
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.name = f'{engine.url.host}:{engine.url.port}'
+        self.healthy = False
+        self.lag: float | None = None
+
+    def mark(self, healthy: bool, reason: str = '') -> None:
+        if healthy != self.healthy:
+            if healthy:
+                logger.info('Replica %s is available', self.name)
+            else:
+                logger.warning('Replica %s is unavailable: %s', self.name, reason)
+        self.healthy = healthy
+
+
+class ReadRouter:
+    """ Направляет читающие соединения на реплики, при их недоступности - на основной сервер """
+
+    def __init__(self, primary: AsyncEngine, replicas: list[AsyncEngine], config: dict[str, dict]):
+        options: dict = config.get('postgres_replicas') or {}
+        self._primary = primary
+        self._replicas = [_Replica(engine) for engine in replicas]
+        self._next = itertools.cycle(self._replicas)
+        self._interval: float = get_option(options, 'health_interval', 5.0, float)
+        self._max_lag: float = get_option(options, 'max_lag', 5.0, float)
+        # Clients that wrote recently read from the primary until the window expires
+        self.read_your_writes: float = get_option(options, 'read_your_writes', 5.0, float)
+        # Bearer clients without cookies (stateless mode included) are known by their user id
+        self._recent_writers = TTLCache(
+            maxsize=get_option(options, 'read_your_writes_maxsize', 100000, int),
+            ttl=self.read_your_writes,
+        )
+
+    @property
+    def has_replicas(self) -> bool:
+        return bool(self._replicas)
+
+    def record_write(self, request: web.Request) -> None:
+        if request.get('user_id') is not None:
+            self._recent_writers.set(request['user_id'], True)
+
+    def _wrote_recently(self, request: web.Request) -> bool:
+        # Known to this worker only; the cookie covers reads served by the other workers
+        if request.get('user_id') is not None and self._recent_writers.get(request['user_id']) is not MISSING:
+            return True
+        # The cookie travels with the client, so it holds whichever worker serves the next read
+        try:
+            written_at = float(request.cookies.get(LAST_WRITE_COOKIE, ''))
+        except ValueError:
+            return False
+        return 0 <= time.time() - written_at < self.read_your_writes
+
+    def _choose(self) -> _Replica | None:
+        for _ in range(len(self._replicas)):
+            replica: _Replica = next(self._next)
+            if replica.healthy:
+                return replica
+        return None
+
+    @asynccontextmanager
+    async def connect(self, request: web.Request) -> AsyncIterator[AsyncConnection]:
+        replica: _Replica | None = None
+        if self._replicas and not self._wrote_recently(request):
+            replica = self._choose()
+
+        connection: AsyncConnection | None = None
+        if replica is not None:
+            try:
+                connection = await replica.engine.connect().start()
+                # Lets services tell replica reads apart (coalescing keys, cache lifetime)
+                await connection.execution_options(replica=True)
+                DB_READS.inc('replica')
+            except (OSError, asyncio.TimeoutError, exc.DBAPIError) as e:
+                replica.mark(False, str(e))
+                DB_READS.inc('fallback')
+
+        if connection is None:
+            connection = await self._primary.connect().start()
+            if replica is None:
+                DB_READS.inc('primary')
+
+        try:
+            yield connection
+        finally:
+            await connection.close()
+
+    async def check(self) -> None:
+        for replica in self._replicas:
+            try:
+                async with asyncio.timeout(self._interval):
+                    async with replica.engine.connect() as connection:
+                        lag = (await connection.execute(LAG_QUERY)).scalar()
+            except (OSError, asyncio.TimeoutError, exc.DBAPIError) as e:
+                replica.lag = None
+                replica.mark(False, str(e) or type(e).__name__)
+                continue
+
+            replica.lag = float(lag or 0)
+            if replica.lag > self._max_lag:
+                replica.mark(False, f'replication lag {replica.lag:.1f}s')
+            else:
+                replica.mark(True)
+
+    async def run_checks(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.check()
+
+    def replicas(self) -> list[dict]:
+        return [{'replica': r.name, 'healthy': r.healthy, 'lag': r.lag} for r in self._replicas]
+
+
+def read_connection(request: web.Request):
+    """ Соединение только для чтения: реплика или основной сервер (async context manager) """
+
+    return request.app['db_router'].connect(request)
+
+
+@web.middleware
+async def track_writes(request: web.Request, handler: _WebHandler) -> web.StreamResponse:
+    """ После успешной записи клиент некоторое время читает с основного сервера (read-your-writes) """
+
+    response = await handler(request)
+    router: ReadRouter = request.app['db_router']
+    window: float = router.read_your_writes
+    if request.method in READ_ONLY_METHODS or response.status >= 400 or not router.has_replicas or window <= 0:
+        return response
+    if request.match_info.route.name == LOGIN_ROUTE:
+        return response
+
+    router.record_write(request)
+    # A streamed response has already sent its headers, so it cannot carry the cookie
+    if not response.prepared:
+        response.set_cookie(
+            LAST_WRITE_COOKIE, f'{time.time():.3f}', max_age=math.ceil(window), httponly=True, samesite='Lax'
+        )
+    return response
+
+
+@REGISTRY.collector
+def _collect_replicas(app: web.Application) -> None:
+    if 'db_router' in app:
+        for replica in app['db_router'].replicas():
+            DB_REPLICA_UP.set(replica['replica'], value=int(replica['healthy']))
+
+
+async def replicas_context(app: web.Application):
+    router = ReadRouter(app['db'], app['db_replicas'], app['config'])
+    app['db_router'] = router
+    task: asyncio.Task | None = None
+    if app['db_replicas']:
+        # Replicas serve reads only after passing the first check
+        await router.check()
+        task = asyncio.create_task(router.run_checks())
+
+    yield
+
+    if task is not None:
+        task.cancel()
@@ -3,13 +3,25 @@ from aiohttp import web
 from views.user import (user_register, UsersCollectView, UserItemView)
 from views.role import (RolesCollectView, RoleItemView)
 from views.auth import AuthView, logout
+from views.bulk import users_bulk_import, users_export
+from views.status import pool_status, cache_status, sql_profiles
+from health import healthz, readyz
+from metrics import metrics_view
 
 
 def setup_routes(application: web.Application) -> None:
     application.router.add_view('/users', UsersCollectView, name='users_collect')
     application.router.add_view(r'/users/{uid:\d+}', UserItemView, name='user_item')
+    application.router.add_route('POST', '/users/bulk', users_bulk_import, name='users_bulk_import')
+    application.router.add_route('GET', '/users/export', users_export, name='users_export')
     application.router.add_view('/roles', RolesCollectView, name='roles_collect')
     application.router.add_view(r'/roles/{rid:\d+}', RoleItemView, name='role_item')
     application.router.add_route('POST', '/login/register', user_register, name='user_register')
     application.router.add_view('/login', AuthView, name='user_auth')
     application.router.add_route('GET', '/logout', logout, name='user_logout')
+    application.router.add_route('GET', '/status/pool', pool_status, name='pool_status')
+    application.router.add_route('GET', '/status/cache', cache_status, name='cache_status')
+    application.router.add_route('GET', '/status/sql', sql_profiles, name='sql_profiles')
+    application.router.add_route('GET', '/metrics', metrics_view, name='metrics')
+    application.router.add_route('GET', '/healthz', healthz, name='healthz')
+    application.router.add_route('GET', '/readyz', readyz, name='readyz')
@@ -0,0 +1,133 @@
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Callable
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+RESTART_DELAY = 1.0
+SHUTDOWN_TIMEOUT = 60.0
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """ Запускает N рабочих процессов на одном порту и перезапускает упавшие """
+
+    def __init__(self,
+                 app_factory: Callable[[], web.Application],
+                 workers: int,
+                 host: str = '0.0.0.0',
+                 port: int = 8080,
+                 reuse_port: bool = False,
+                 ):
+
+        self._app_factory = app_factory
+        self._workers = workers
+        self._host = host
+        self._port = port
+        self._reuse_port = reuse_port
+        self._sock: socket.socket | None = None
+        self._children: dict[int, float] = {}
+        self._stopping = False
+
+    def _run_worker(self) -> None:
+        # Engine, pools and caches are created by the application's cleanup contexts inside the worker
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        app: web.Application = self._app_factory()
+        if self._reuse_port:
+            web.run_app(app, host=self._host, port=self._port, reuse_port=True,
+                        shutdown_timeout=SHUTDOWN_TIMEOUT, print=None)
+        else:
+            web.run_app(app, sock=self._sock, shutdown_timeout=SHUTDOWN_TIMEOUT, print=None)
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._run_worker()
+            except BaseException:
+                logger.exception('Worker %s failed', os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+
+        self._children[pid] = time.monotonic()
+        logger.info('Worker %s started', pid)
+
+    def _stop(self, signum: int, frame) -> None:
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _wait_children(self) -> None:
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        while self._children and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self._children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+
+        for pid in self._children:
+            os.kill(pid, signal.SIGKILL)
+
+    def run(self) -> None:
+        if not self._reuse_port:
+            self._sock = _bind_socket(self._host, self._port)
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        for _ in range(self._workers):
+            self._spawn()
+
+        while not self._stopping:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+
+            started: float | None = self._children.pop(pid, None)
+            if started is None or self._stopping:
+                continue
+
+            logger.warning('Worker %s exited with status %s, restarting', pid, os.waitstatus_to_exitcode(status))
+            # Do not spin when a worker crashes on startup
+            if time.monotonic() - started < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            if not self._stopping:
+                self._spawn()
+
+        self._wait_children()
+        if self._sock is not None:
+            self._sock.close()
+
+
+def run_workers(app_factory: Callable[[], web.Application], workers: int,
+                host: str = '0.0.0.0', port: int = 8080, reuse_port: bool = False) -> None:
+    if workers <= 1:
+        web.run_app(app_factory(), host=host, port=port)
+        return
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    Supervisor(app_factory, workers, host, port, reuse_port).run()
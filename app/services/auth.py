@@ -6,31 +6,37 @@ from aiohttp import web
 
 from services.pas import PasService
 from services.role import RoleService
+from services.token import TokenService
 from services.user import UserService
 
+ACCESS = 'access'
+REFRESH = 'refresh'
+
 
 class AuthService:
     def __init__(self,
                  config: dict[str, dict],
                  user_service: UserService,
                  role_service: RoleService,
-                 pas_service: PasService
+                 pas_service: PasService,
+                 token_service: TokenService,
                  ):
 
         self._config = config
         self._user_service = user_service
         self._role_service = role_service
         self._pas_service = pas_service
+        self._token_service = token_service
 
     async def _get_options(self) -> dict[str, str]:
         return self._config['jwt']
 
-    async def _check_credentials(self, credentials: dict[str, str], is_refresh: bool = False) -> dict[str, str]:
+    async def check_credentials(self, credentials: dict[str, str], is_refresh: bool = False) -> dict[str, str]:
         username: str = credentials.get('username', None)
         password: str = credentials.get('password', None)
 
-        # Check user
-        user: dict | None = await self._user_service.get_by_username(username)
+        # Check user (the role is fetched in the same query)
+        user: dict | None = await self._user_service.get_by_username_with_role(username)
         if not user:
             raise web.HTTPBadRequest
 
@@ -39,31 +45,32 @@ class AuthService:
             if not await self._pas_service.compare_passwords(user['password'], password):
                 raise web.HTTPBadRequest
 
-        # TODO: Рассмотреть возможность применения JOIN (при запросе user)
-        role: dict = await self._role_service.get_by_id(user['roles_id'])
-        user['role'] = role['role']
-
         return user
 
-    async def generate_tokens(self, auth_data: dict, is_refresh: bool = False) -> dict[str, str]:
+    async def issue_tokens(self, user: dict, family: str | None = None) -> dict[str, str]:
         options: dict[str, str] = await self._get_options()
 
-        user: dict = await self._check_credentials(auth_data, is_refresh)
-
+        # A login starts a new token family, a refresh continues the family of the consumed token
         data = {
             'id': user['id'],
             'username': user['username'],
             'role': user['role'],
+            'fam': family or self._token_service.new_id(),
         }
 
         # Access token generation
         exp_min = datetime.datetime.utcnow() + datetime.timedelta(minutes=float(options['exp_min']))
         data['exp'] = calendar.timegm(exp_min.timetuple())
+        data['typ'] = ACCESS
         access_token = jwt.encode(payload=data, key=options['secret'], algorithm=options['algorithm'])
 
         # Refresh token generation
         exp_days = datetime.datetime.utcnow() + datetime.timedelta(days=float(options['exp_days']))
         data['exp'] = calendar.timegm(exp_days.timetuple())
+        data['typ'] = REFRESH
+        data['jti'] = await self._token_service.issue(
+            user['id'], data['fam'], exp_days.replace(tzinfo=datetime.timezone.utc)
+        )
         refresh_token = jwt.encode(payload=data, key=options['secret'], algorithm=options['algorithm'])
 
         return {
@@ -71,9 +78,23 @@ class AuthService:
             'refresh_token': refresh_token,
         }
 
-    async def approve_refresh_token(self, token: str) -> dict[str, str]:
+    async def generate_tokens(self, auth_data: dict, is_refresh: bool = False) -> dict[str, str]:
+        user: dict = await self.check_credentials(auth_data, is_refresh)
+        return await self.issue_tokens(user)
+
+    async def decode_refresh_token(self, token: str) -> dict[str, str]:
         options: dict[str, str] = await self._get_options()
-        refresh_token: str = token
-        data: dict[str, str] = jwt.decode(jwt=refresh_token, key=options['secret'], algorithms=[options['algorithm']])
+        try:
+            data: dict[str, str] = jwt.decode(jwt=token, key=options['secret'], algorithms=[options['algorithm']])
+        except jwt.exceptions.PyJWTError:
+            raise web.HTTPBadRequest
+
+        # Access tokens and refresh tokens issued before rotation was introduced are not accepted
+        if data.get('typ') != REFRESH or 'jti' not in data:
+            raise web.HTTPBadRequest
+        return data
+
+    async def rotate_refresh_token(self, data: dict[str, str]) -> str:
+        """ Использует refresh-токен и возвращает его семейство """
 
-        return await self.generate_tokens(auth_data=data, is_refresh=True)
+        return await self._token_service.rotate(data['jti'])
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict
+
+from aiohttp import web
+
+from metrics import PBKDF2_SECONDS
+from settings import get_option
+
+
+def _derive(hash_name: str, password: bytes, salt: bytes, iterations: int) -> bytes:
+    # Выполняется в пуле (поток или процесс), поэтому функция должна быть на уровне модуля
+    return hashlib.pbkdf2_hmac(hash_name=hash_name, password=password, salt=salt, iterations=iterations)
+
+
+class HashingEngine:
+    """ Выполняет PBKDF2 в пуле потоков/процессов, не блокируя event loop """
+
+    def __init__(self, config: Dict[str, dict]):
+        options: dict = config.get('hashlib', {})
+        self._kind: str = get_option(options, 'executor', 'thread')
+        self._workers: int = get_option(options, 'workers', os.cpu_count() or 1, int)
+        self._max_concurrency: int = get_option(options, 'max_concurrency', self._workers, int)
+        self._executor: Executor | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._waiting: int = 0
+        self._running: int = 0
+        self._completed: int = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self._kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self._workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='pbkdf2')
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._semaphore
+
+    async def derive(self, hash_name: str, password: bytes, salt: bytes, iterations: int) -> bytes:
+        loop = asyncio.get_running_loop()
+        semaphore = self._get_semaphore()
+
+        self._waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(
+                self._get_executor(), _derive, hash_name, password, salt, iterations
+            )
+        finally:
+            PBKDF2_SECONDS.observe(value=time.perf_counter() - started)
+            self._running -= 1
+            self._completed += 1
+            semaphore.release()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    def stats(self) -> dict[str, int | str]:
+        return {
+            'executor': self._kind,
+            'workers': self._workers,
+            'max_concurrency': self._max_concurrency,
+            'queue_depth': self._waiting,
+            'running': self._running,
+            'completed': self._completed,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+_engine: HashingEngine | None = None
+
+
+def get_hashing_engine(config: Dict[str, dict]) -> HashingEngine:
+    """ Возвращает общий для процесса экземпляр HashingEngine """
+
+    global _engine
+    if _engine is None:
+        _engine = HashingEngine(config)
+    return _engine
+
+
+async def hashing_context(app: web.Application):
+    app['hashing'] = get_hashing_engine(app['config'])
+
+    yield
+
+    app['hashing'].shutdown()
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+import asyncpg
+from aiohttp import web
+from sqlalchemy import exc
+
+from metrics import REGISTRY, Gauge
+
+logger = logging.getLogger(__name__)
+
+_Callback = Callable[[asyncpg.Connection, int, str, str], None]
+
+# on_connect callbacks may reload state through the SQLAlchemy engine
+_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError, exc.SQLAlchemyError)
+
+RETRY_INTERVAL = 1.0
+
+LISTENER_UP = REGISTRY.register(Gauge(
+    'db_listener_up', 'LISTEN connection of the channel is established.', ('channel',)))
+
+# Channel -> listener of this process, for readiness and metrics
+listeners: dict[str, 'NotifyListener'] = {}
+
+
+class NotifyListener:
+    """ LISTEN на отдельном соединении asyncpg; после обрыва соединение восстанавливается """
+
+    def __init__(self, conf: dict[str, Any], channel: str, callback: _Callback,
+                 on_connect: Callable[[], Awaitable[None]] | None = None,
+                 check_interval: float = 30.0, max_retry_interval: float = 30.0):
+        self._conf = conf
+        self._channel = channel
+        self._callback = callback
+        # Runs after every (re)connection: notifications sent while disconnected are lost
+        self._on_connect = on_connect
+        self._check_interval = check_interval
+        self._max_retry_interval = max_retry_interval
+        self._connection: asyncpg.Connection | None = None
+        self._lost = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def channel(self) -> str:
+        return self._channel
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None and not self._connection.is_closed()
+
+    async def _connect(self) -> None:
+        conf = self._conf
+        connection: asyncpg.Connection = await asyncpg.connect(
+            user=conf['user'], password=conf['password'],
+            host=conf['host'], port=conf['port'], database=conf['database'],
+        )
+        try:
+            lost = self._lost = asyncio.Event()
+            connection.add_termination_listener(lambda _: lost.set())
+            await connection.add_listener(self._channel, self._callback)
+            if self._on_connect is not None:
+                await self._on_connect()
+        except BaseException:
+            await connection.close()
+            raise
+        self._connection = connection
+
+    def _drop(self) -> None:
+        connection, self._connection = self._connection, None
+        if connection is not None and not connection.is_closed():
+            connection.terminate()
+
+    async def _alive(self) -> bool:
+        # A dropped socket fires the termination listener; a silently dead peer is found by the check query
+        try:
+            await asyncio.wait_for(self._lost.wait(), self._check_interval)
+            return False
+        except asyncio.TimeoutError:
+            pass
+        try:
+            await asyncio.wait_for(self._connection.execute('SELECT 1'), self._check_interval)
+            return True
+        except _ERRORS:
+            return False
+
+    async def _run(self) -> None:
+        retry = RETRY_INTERVAL
+        if not self.connected:
+            # start() has just failed to connect
+            await asyncio.sleep(retry)
+        while True:
+            if self.connected:
+                if await self._alive():
+                    continue
+                logger.warning('LISTEN connection for %s is lost, reconnecting', self._channel)
+                self._drop()
+
+            try:
+                await self._connect()
+            except _ERRORS as e:
+                logger.warning('LISTEN connection for %s failed, retry in %.0fs: %s', self._channel, retry, e)
+                await asyncio.sleep(retry)
+                retry = min(retry * 2, self._max_retry_interval)
+                continue
+            logger.info('LISTEN connection for %s is established', self._channel)
+            retry = RETRY_INTERVAL
+
+    async def start(self) -> None:
+        """ Первое подключение до начала обслуживания запросов, дальше - в фоне """
+
+        listeners[self._channel] = self
+        try:
+            await self._connect()
+        except _ERRORS as e:
+            logger.warning('LISTEN connection for %s is not available yet: %s', self._channel, e)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        listeners.pop(self._channel, None)
+        if self._task is not None:
+            self._task.cancel()
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            await connection.close()
+
+
+@REGISTRY.collector
+def _collect_listeners(app: web.Application) -> None:
+    for channel, listener in listeners.items():
+        LISTENER_UP.set(channel, value=int(listener.connected))
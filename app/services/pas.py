@@ -1,13 +1,15 @@
 import base64
-import hashlib
 import hmac
 from typing import Dict
 
+from services.hashing import HashingEngine, get_hashing_engine
+
 
 class PasService:
 
-    def __init__(self, config: Dict[str, dict]):
+    def __init__(self, config: Dict[str, dict], engine: HashingEngine | None = None):
         self._config: Dict[str, dict] = config
+        self._engine: HashingEngine = engine or get_hashing_engine(config)
 
     async def _get_options(self) -> Dict[str, str]:
         return self._config['hashlib']
@@ -23,7 +25,7 @@ class PasService:
         password = await self._string_to_bytes(password)
         salt = await self._string_to_bytes(options['salt'])
 
-        hash_digest = hashlib.pbkdf2_hmac(
+        hash_digest = await self._engine.derive(
             hash_name=options['hash_name'],
             password=password,
             salt=salt,
@@ -38,12 +40,11 @@ class PasService:
         other_password = await self._string_to_bytes(other_password)
         salt = await self._string_to_bytes(options['salt'])
 
-        return hmac.compare_digest(
-            base64.b64decode(password_hash),
-            hashlib.pbkdf2_hmac(
-                hash_name=options['hash_name'],
-                password=other_password,
-                salt=salt,
-                iterations=int(options['iterations']),
-            )
+        other_hash = await self._engine.derive(
+            hash_name=options['hash_name'],
+            password=other_password,
+            salt=salt,
+            iterations=int(options['iterations']),
         )
+
+        return hmac.compare_digest(base64.b64decode(password_hash), other_hash)
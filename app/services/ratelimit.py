@@ -0,0 +1,107 @@
+import hashlib
+import math
+import time
+from typing import Callable
+
+from aiohttp import web
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from dao.login_bucket import LoginBucketDAO
+from settings import get_option
+
+
+class MemoryBucketStore:
+    """ Token buckets этого процесса: ключ -> (токены, время последнего пополнения) """
+
+    def __init__(self, sweep_interval: float = 60.0, timer: Callable[[], float] = time.monotonic):
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._sweep_interval = sweep_interval
+        self._timer = timer
+        self._last_sweep = timer()
+        # Longest time any bucket needs to refill completely
+        self._idle_after = 0.0
+
+    def _sweep(self, now: float) -> None:
+        # A bucket that has refilled completely is the same as a missing one
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < self._idle_after
+        }
+        self._last_sweep = now
+
+    async def take(self, key: str, rate: float, capacity: float) -> float:
+        now = self._timer()
+        self._idle_after = max(self._idle_after, capacity / rate if rate else float('inf'))
+        if now - self._last_sweep > self._sweep_interval:
+            self._sweep(now)
+
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            self._buckets[key] = (tokens, now)
+            return tokens
+
+        self._buckets[key] = (tokens, now)
+        return tokens - 1
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class PostgresBucketStore:
+    """ Token buckets, общие для всех workers (UNLOGGED-таблица login_buckets) """
+
+    def __init__(self, engine: AsyncEngine, sweep_interval: float = 60.0):
+        self._engine = engine
+        self._sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self._idle_after = 0.0
+
+    async def take(self, key: str, rate: float, capacity: float) -> float:
+        now = time.monotonic()
+        self._idle_after = max(self._idle_after, capacity / rate if rate else float('inf'))
+        async with self._engine.begin() as connection:
+            dao = LoginBucketDAO(connection)
+            if now - self._last_sweep > self._sweep_interval and self._idle_after != float('inf'):
+                self._last_sweep = now
+                await dao.delete_idle(self._idle_after)
+            return await dao.take(key, rate, capacity)
+
+
+class LoginThrottle:
+    """ Token buckets по IP и username; проверяются до проверки учётных данных """
+
+    def __init__(self, store: MemoryBucketStore | PostgresBucketStore, options: dict):
+        self._store = store
+        self._enabled: bool = get_option(options, 'enabled', True, bool)
+        self._ip_rate: float = get_option(options, 'ip_rate', 1.0, float)
+        self._ip_burst: float = get_option(options, 'ip_burst', 20.0, float)
+        self._user_rate: float = get_option(options, 'user_rate', 0.1, float)
+        self._user_burst: float = get_option(options, 'user_burst', 5.0, float)
+
+    async def _take(self, key: str, rate: float, capacity: float) -> None:
+        tokens: float = await self._store.take(key, rate, capacity)
+        if tokens < 0:
+            retry_after = (-tokens) / rate if rate else 60.0
+            raise web.HTTPTooManyRequests(headers={'Retry-After': str(max(1, math.ceil(retry_after)))})
+
+    async def check(self, username: str, ip: str | None) -> None:
+        if not self._enabled:
+            return
+        if ip:
+            await self._take(f'ip:{ip}', self._ip_rate, self._ip_burst)
+        # Usernames are not validated before the throttle: the digest bounds the key length (String(200) column)
+        digest: str = hashlib.sha256(username.encode()).hexdigest()
+        await self._take(f'user:{digest}', self._user_rate, self._user_burst)
+
+
+async def login_throttle_context(app: web.Application):
+    options: dict = app['config'].get('ratelimit', {})
+    sweep_interval: float = get_option(options, 'sweep_interval', 60.0, float)
+    if get_option(options, 'backend', 'memory') == 'postgres':
+        store = PostgresBucketStore(app['db'], sweep_interval)
+    else:
+        store = MemoryBucketStore(sweep_interval)
+    app['login_throttle'] = LoginThrottle(store, options)
+
+    yield
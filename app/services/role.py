@@ -1,19 +1,68 @@
+import logging
 from typing import Dict, Any, Sequence
 
+from aiohttp import web
 from sqlalchemy import Row
 
-from dao.role import RoleDAO
+from dao.role import RoleDAO, ROLES_CHANNEL, LIST_CHANGED
 from dao.database.schemas import role
+from services.cache import TTLCache, MISSING
+from services.listener import NotifyListener
 from services.pas import PasService
-from settings import config
+from services.singleflight import SingleFlight
+from settings import config, get_option
+
+logger = logging.getLogger(__name__)
 
 pas_service = PasService(config)
 
+_cache_options: dict = config.get('cache', {})
+role_cache = TTLCache(
+    maxsize=get_option(_cache_options, 'role_maxsize', 1024, int),
+    ttl=get_option(_cache_options, 'role_ttl', 300.0, float),
+)
+# Rows read from a replica may predate the last NOTIFY, so they are cached only for the tolerated lag
+replica_ttl: float = get_option(config.get('postgres_replicas'), 'max_lag', 5.0, float)
+role_flight = SingleFlight('roles', get_option(_cache_options, 'singleflight_max_keys', 10000, int))
+ALL_ROLES_KEY = 'all'
+
+
+def collection_version(roles: Sequence[dict]) -> str:
+    """ То же значение, что RoleDAO.get_collection_version, но вычисленное по самому списку ролей """
+
+    count = len(roles)
+    max_id = max((row['id'] for row in roles), default=0)
+    total = sum(row['version'] for row in roles)
+    return f'{count}.{max_id}.{total}'
+
 
 class RoleService:
 
-    def __init__(self, dao: RoleDAO):
+    def __init__(self, dao: RoleDAO, cache: TTLCache = role_cache):
         self._dao = dao
+        self._cache = cache
+
+    async def _invalidate(self, rid: int | None = None) -> None:
+        if rid is None:
+            self._cache.invalidate(ALL_ROLES_KEY)
+            role_flight.forget(ALL_ROLES_KEY)
+        else:
+            self._cache.invalidate(ALL_ROLES_KEY, rid)
+            role_flight.forget(ALL_ROLES_KEY, rid)
+        # Other workers drop their entries once the transaction commits
+        await self._dao.notify(LIST_CHANGED if rid is None else str(rid))
+
+    def _flight_key(self, key: Any) -> Any:
+        return ('replica', key) if self._dao.on_replica else key
+
+    def _cache_ttl(self) -> float | None:
+        return min(self._cache.ttl, replica_ttl) if self._dao.on_replica else None
+
+    def invalidate_local(self) -> None:
+        """ Сброс списка ролей только в этом процессе, без NOTIFY """
+
+        self._cache.invalidate(ALL_ROLES_KEY)
+        role_flight.forget(ALL_ROLES_KEY)
 
     async def create(self, data: dict = None) -> Dict[str, str | Any] | None:
         created_role: Row[role] | None = await self._dao.create(data)
@@ -21,23 +70,54 @@ class RoleService:
         if not created_role:
             return None
 
+        await self._invalidate()
+
         data = {
             'id': created_role.id,
             'role': created_role.role,
         }
         return data
 
+    async def bulk_create(self, count: int) -> Sequence[int]:
+        """ Без сброса кэша: после всех пакетов вызывающий код один раз вызывает invalidate_list """
+
+        return await self._dao.bulk_create(count)
+
+    async def invalidate_list(self) -> None:
+        """ Сброс списка ролей во всех процессах (одним NOTIFY) """
+
+        await self._invalidate()
+
     async def get_all(self) -> list[dict | None]:
+        cached: list[dict] = self._cache.get(ALL_ROLES_KEY)
+        if cached is not MISSING:
+            return [dict(row) for row in cached]
+
+        # On a cache miss concurrent callers share one query
+        roles_data: list[dict] = await role_flight.do(self._flight_key(ALL_ROLES_KEY), self._fetch_all)
+        return [dict(row) for row in roles_data]
+
+    async def _fetch_all(self) -> list[dict]:
         roles: Sequence[Row[role]] = await self._dao.get_all()
         roles_data = []
         for row in roles:
             roles_data.append({
                 'id': row.id,
                 'role': row.role,
+                'version': row.version,
             })
+        self._cache.set(ALL_ROLES_KEY, roles_data, ttl=self._cache_ttl())
         return roles_data
 
     async def get_by_id(self, rid: int) -> Dict[str, str | Any] | None:
+        cached: dict = self._cache.get(rid)
+        if cached is not MISSING:
+            return dict(cached)
+
+        data: dict | None = await role_flight.do(self._flight_key(rid), lambda: self._fetch_by_id(rid))
+        return dict(data) if data else None
+
+    async def _fetch_by_id(self, rid: int) -> Dict[str, str | Any] | None:
         role_data: Row[role] = await self._dao.get_by_id(rid)
 
         if not role_data:
@@ -46,10 +126,29 @@ class RoleService:
         data = {
             'id': role_data.id,
             'role': role_data.role,
+            'version': role_data.version,
         }
+        self._cache.set(rid, data, ttl=self._cache_ttl())
         return data
 
+    async def get_version(self, rid: int) -> int | None:
+        cached: dict = self._cache.get(rid)
+        if cached is not MISSING:
+            return cached['version']
+        return await self._dao.get_version(rid)
+
+    async def get_collection_version(self) -> str:
+        """ Версия списка ролей; при наличии кэша вычисляется по нему """
+
+        cached: list[dict] = self._cache.get(ALL_ROLES_KEY)
+        if cached is not MISSING:
+            return collection_version(cached)
+
+        count, max_id, total = await self._dao.get_collection_version()
+        return f'{count}.{max_id or 0}.{total or 0}'
+
     async def update(self, data: dict) -> bool | None:
+        rid: int = data['id']
         updated_data: Row[role] | bool = await self._dao.update(data)
 
         if isinstance(updated_data, bool) and not updated_data:
@@ -58,6 +157,7 @@ class RoleService:
         if not updated_data:
             return None
 
+        await self._invalidate(rid)
         return True
 
     async def delete(self, rid: int) -> Dict[str, str | Any] | None:
@@ -66,8 +166,47 @@ class RoleService:
         if not deleted_role:
             return None
 
+        await self._invalidate(rid)
+
         data = {
             'id': deleted_role.id,
             'role': deleted_role.role,
         }
         return data
+
+    async def delete_uncommitted(self, ids: Sequence[int]) -> None:
+        """ Удаление ролей, созданных в этой же транзакции: их не видел ни один процесс, сбрасывать нечего """
+
+        await self._dao.delete_many(ids)
+
+
+def _on_roles_changed(connection, pid: int, channel: str, payload: str) -> None:
+    # Also fires for our own NOTIFY: this drops anything re-cached between invalidation and commit
+    if payload.isdigit():
+        role_cache.invalidate(ALL_ROLES_KEY, int(payload))
+        role_flight.forget(ALL_ROLES_KEY, int(payload))
+    elif payload == LIST_CHANGED:
+        # Roles were added: cached roles are still valid, only the list is not
+        role_cache.invalidate(ALL_ROLES_KEY)
+        role_flight.forget(ALL_ROLES_KEY)
+    else:
+        # Unknown payload: any role may have changed
+        role_cache.clear()
+        role_flight.forget(ALL_ROLES_KEY)
+
+
+async def _on_roles_listener_connected() -> None:
+    # Changes made while the listener was down were not announced
+    role_cache.clear()
+    role_flight.forget(ALL_ROLES_KEY)
+
+
+async def role_cache_context(app: web.Application):
+    listener = NotifyListener(
+        app['config']['postgres'], ROLES_CHANNEL, _on_roles_changed, on_connect=_on_roles_listener_connected
+    )
+    await listener.start()
+
+    yield
+
+    await listener.close()
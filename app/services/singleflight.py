@@ -0,0 +1,61 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from metrics import SINGLEFLIGHT_CALLS
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """ Объединяет одинаковые одновременные запросы: к БД уходит один, результат получают все """
+
+    def __init__(self, name: str, max_keys: int = 10000):
+        self._name = name
+        self._max_keys = max_keys
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        future: asyncio.Future | None = self._calls.get(key)
+        if future is not None:
+            SINGLEFLIGHT_CALLS.inc(self._name, 'merged')
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leader was cancelled (deadline, client gone): repeat the lookup on our own
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    return await self.do(key, func)
+                raise
+
+        if len(self._calls) >= self._max_keys:
+            # Tracking is bounded; past the limit calls simply run on their own
+            SINGLEFLIGHT_CALLS.inc(self._name, 'bypassed')
+            return await func()
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        SINGLEFLIGHT_CALLS.inc(self._name, 'executed')
+        try:
+            result: T = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody was waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def forget(self, *keys: Hashable) -> None:
+        """ Вызовы после записи не должны присоединяться к чтению, начатому до неё """
+
+        for key in keys:
+            self._calls.pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        return {'in_flight': len(self._calls), 'max_keys': self._max_keys}
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+
+from aiohttp import web
+from sqlalchemy import Row, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from dao.refresh_token import RefreshTokenDAO, TOKENS_CHANNEL
+from metrics import REGISTRY, Gauge
+from services.listener import NotifyListener
+from settings import config, get_option
+
+logger = logging.getLogger(__name__)
+
+# Access tokens of a revoked family stay valid at most this long after the revocation
+ACCESS_TOKEN_LIFETIME: float = float(config['jwt']['exp_min']) * 60
+PRUNE_INTERVAL = 60.0
+
+TOKEN_REVOCATIONS = REGISTRY.register(Gauge(
+    'token_revoked_families', 'Revoked token families kept in the in-memory index.'))
+
+
+class RevocationIndex:
+    """ Отозванные семейства токенов в памяти процесса: проверка access-токена без обращения к БД """
+
+    def __init__(self, lifetime: float = ACCESS_TOKEN_LIFETIME):
+        self._lifetime = lifetime
+        # family -> time (epoch) after which no access token of the family can still be valid
+        self._families: dict[str, float] = {}
+        self._next_prune = 0.0
+
+    def add(self, family: str, revoked_at: float | None = None) -> None:
+        now = time.time()
+        self._families[family] = (revoked_at or now) + self._lifetime
+        if now >= self._next_prune:
+            self._families = {key: until for key, until in self._families.items() if until > now}
+            self._next_prune = now + PRUNE_INTERVAL
+
+    def is_revoked(self, family: str | None) -> bool:
+        return family is not None and family in self._families
+
+    def __len__(self) -> int:
+        return len(self._families)
+
+
+revocation_index = RevocationIndex()
+
+
+class TokenService:
+    """ Refresh-токены: выдача, ротация при использовании и отзыв семейства при повторном использовании """
+
+    def __init__(self, engine: AsyncEngine, index: RevocationIndex = revocation_index):
+        # Token writes always go to the primary, in their own short transactions
+        self._engine = engine
+        self._index = index
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    async def issue(self, user_id: int, family: str, expires: datetime) -> str:
+        jti: str = self.new_id()
+        async with self._engine.begin() as connection:
+            await RefreshTokenDAO(connection).create(jti, family, user_id, expires)
+        return jti
+
+    async def rotate(self, jti: str) -> str:
+        """ Использует refresh-токен и возвращает его семейство """
+
+        async with self._engine.begin() as connection:
+            dao = RefreshTokenDAO(connection)
+            used: Row | None = await dao.use(jti)
+            if used is not None:
+                return used.family
+
+            token: Row | None = await dao.get(jti)
+            if token is None or token.revoked_at is not None:
+                raise web.HTTPUnauthorized()
+
+            # The token was presented again: it may have been stolen, so the whole family is revoked
+            logger.warning('Refresh token reuse detected, revoking family %s', token.family)
+            await dao.revoke_family(token.family)
+
+        self._index.add(token.family)
+        raise web.HTTPUnauthorized()
+
+    async def revoke(self, family: str) -> None:
+        async with self._engine.begin() as connection:
+            await RefreshTokenDAO(connection).revoke_family(family)
+        self._index.add(family)
+
+
+def _on_tokens_revoked(connection, pid: int, channel: str, payload: str) -> None:
+    revocation_index.add(payload)
+
+
+@REGISTRY.collector
+def _collect_revocations(app: web.Application) -> None:
+    TOKEN_REVOCATIONS.set(value=len(revocation_index))
+
+
+async def _delete_expired(engine: AsyncEngine, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with engine.begin() as connection:
+                await RefreshTokenDAO(connection).delete_expired()
+        except (OSError, exc.SQLAlchemyError) as e:
+            logger.warning('Expired refresh tokens were not deleted: %s', e)
+
+
+async def revocation_context(app: web.Application):
+    options: dict = app['config']['jwt']
+
+    async def load_revoked() -> None:
+        # Families revoked recently enough for their access tokens to be still valid,
+        # including those revoked while the listener was disconnected
+        async with app['db'].connect() as connection:
+            for row in await RefreshTokenDAO(connection).get_revoked_since(ACCESS_TOKEN_LIFETIME):
+                revocation_index.add(row.family, float(row.revoked_at))
+
+    listener = NotifyListener(app['config']['postgres'], TOKENS_CHANNEL, _on_tokens_revoked, on_connect=load_revoked)
+    await listener.start()
+
+    cleanup = asyncio.create_task(
+        _delete_expired(app['db'], get_option(options, 'cleanup_interval', 3600.0, float))
+    )
+
+    yield
+
+    cleanup.cancel()
+    await listener.close()
@@ -1,13 +1,16 @@
-from typing import Dict, Any, Sequence
+from datetime import datetime
+from typing import Dict, Any, AsyncIterator, Sequence
 
 from sqlalchemy import Row
 
 from dao.user import UserDAO
 from dao.database.schemas import user
 from services.pas import PasService
-from settings import config
+from services.singleflight import SingleFlight
+from settings import config, get_option
 
 pas_service = PasService(config)
+user_flight = SingleFlight('users', get_option(config.get('cache', {}), 'singleflight_max_keys', 10000, int))
 
 
 class UserService:
@@ -15,6 +18,18 @@ class UserService:
     def __init__(self, dao: UserDAO):
         self._dao = dao
 
+    @staticmethod
+    def _row_to_dict(row: Row[user]) -> Dict[str, str | Any]:
+        return {
+            'id': row.id,
+            'first_name': row.first_name,
+            'last_name': row.last_name,
+            'username': row.username,
+            'date_of_birth': row.date_of_birth,
+            'created': str(row.created),
+            'roles_id': row.roles_id,
+        }
+
     async def create(self, data: dict) -> Dict[str, str | Any] | None:
         data['password'] = await pas_service.encode_password(data.get('password'))
         created_user: Row[user] = await self._dao.create(data)
@@ -34,6 +49,30 @@ class UserService:
 
         return data
 
+    async def create_with_role(self, data: dict) -> Dict[str, str | Any] | None:
+        # A taken username is rejected before the hashing cost is paid
+        if await self._dao.username_exists(data.get('username')):
+            return None
+
+        data['password'] = await pas_service.encode_password(data.get('password'))
+        created_user: Row | None = await self._dao.create_with_role(data)
+
+        if not created_user:
+            return None
+
+        data = self._row_to_dict(created_user)
+        data['role'] = created_user.role
+        return data
+
+    async def bulk_create(self, rows: list[dict]) -> dict[str, int]:
+        """ Вставляет строки с уже захэшированными паролями, возвращает {username: id} созданных пользователей """
+
+        created: Sequence[Row] = await self._dao.bulk_create(rows)
+        return {row.username: row.id for row in created}
+
+    async def get_existing_usernames(self, usernames: Sequence[str]) -> set[str]:
+        return await self._dao.get_existing_usernames(usernames)
+
     async def get_all(self) -> list[dict | None]:
         users: Sequence[Row[user]] = await self._dao.get_all()
         users_data = []
@@ -49,7 +88,34 @@ class UserService:
             })
         return users_data
 
+    async def get_page(self, limit: int, after: int | None = None) -> list[dict]:
+        users: Sequence[Row[user]] = await self._dao.get_page(limit, after)
+        return [self._row_to_dict(row) for row in users]
+
+    async def iter_all(self, batch_size: int) -> AsyncIterator[list[dict]]:
+        async for rows in self._dao.stream_all(batch_size):
+            yield [self._row_to_dict(row) for row in rows]
+
+    async def iter_with_roles(self, batch_size: int, since: datetime | None = None) -> AsyncIterator[list[dict]]:
+        async for rows in self._dao.stream_with_roles(batch_size, since):
+            yield [{
+                'id': row.id,
+                'first_name': row.first_name,
+                'last_name': row.last_name,
+                'username': row.username,
+                'date_of_birth': row.date_of_birth.isoformat() if row.date_of_birth else None,
+                'created': row.created.isoformat() if row.created else None,
+                'roles_id': row.roles_id,
+                'role': row.role,
+            } for row in rows]
+
     async def get_by_id(self, uid: int) -> Dict[str, str | Any] | None:
+        # Concurrent lookups of the same user share one query; replica reads never serve read-your-writes clients
+        key = ('replica', uid) if self._dao.on_replica else uid
+        data: dict | None = await user_flight.do(key, lambda: self._fetch_by_id(uid))
+        return dict(data) if data else None
+
+    async def _fetch_by_id(self, uid: int) -> Dict[str, str | Any] | None:
         user_data: Row[user] = await self._dao.get_by_id(uid)
 
         if not user_data:
@@ -64,6 +130,7 @@ class UserService:
             'date_of_birth': user_data.date_of_birth,
             'created': str(user_data.created),
             'roles_id': user_data.roles_id,
+            'version': user_data.version,
         }
         return data
 
@@ -85,7 +152,30 @@ class UserService:
         }
         return data
 
+    async def get_by_username_with_role(self, username: str) -> Dict[str, str | Any] | None:
+        user_data: Row | None = await self._dao.get_by_username_with_role(username)
+
+        if not user_data:
+            return None
+
+        data = {
+            'id': user_data.id,
+            'first_name': user_data.first_name,
+            'last_name': user_data.last_name,
+            'username': user_data.username,
+            'password': user_data.password,
+            'date_of_birth': user_data.date_of_birth,
+            'created': str(user_data.created),
+            'roles_id': user_data.roles_id,
+            'role': user_data.role,
+        }
+        return data
+
+    async def get_version(self, uid: int) -> int | None:
+        return await self._dao.get_version(uid)
+
     async def update(self, data: dict) -> bool | None:
+        uid: int = data['id']
         updated_data: Row[user] | bool = await self._dao.update(data)
 
         if isinstance(updated_data, bool) and not updated_data:
@@ -94,6 +184,7 @@ class UserService:
         if not updated_data:
             return None
 
+        user_flight.forget(uid)
         return True
 
     async def delete(self, uid: int) -> Dict[str, str | Any] | None:
@@ -102,6 +193,8 @@ class UserService:
         if not deleted_user:
             return None
 
+        user_flight.forget(uid)
+
         data = {
             'id': deleted_user.id,
             'first_name': deleted_user.first_name,
@@ -0,0 +1,149 @@
+import abc
+import base64
+import logging
+import time
+import uuid
+
+import aiohttp_session
+from aiohttp import web
+from aiohttp_session import AbstractStorage, Session
+from aiohttp_session.cookie_storage import EncryptedCookieStorage
+from cryptography import fernet
+
+from dao.session import SessionDAO
+from services.cache import TTLCache, MISSING
+from settings import get_option
+
+logger = logging.getLogger(__name__)
+
+BACKEND_NONE = 'none'
+BACKEND_COOKIE = 'cookie'
+BACKEND_MEMORY = 'memory'
+BACKEND_POSTGRES = 'postgres'
+
+
+class _ServerSideStorage(AbstractStorage):
+    """ В cookie только случайный ключ сессии, данные хранятся на сервере """
+
+    def __init__(self, max_age: int, **kwargs):
+        super().__init__(max_age=max_age, **kwargs)
+
+    @abc.abstractmethod
+    async def _get(self, request: web.Request, key: str) -> str | None:
+        ...
+
+    @abc.abstractmethod
+    async def _set(self, request: web.Request, key: str, data: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def _delete(self, request: web.Request, key: str) -> None:
+        ...
+
+    async def load_session(self, request: web.Request) -> Session:
+        key: str | None = self.load_cookie(request)
+        data: str | None = await self._get(request, key) if key else None
+        if data is None:
+            return Session(None, data=None, new=True, max_age=self.max_age)
+        try:
+            return Session(key, data=self._decoder(data), new=False, max_age=self.max_age)
+        except ValueError:
+            return Session(None, data=None, new=True, max_age=self.max_age)
+
+    async def save_session(self, request: web.Request, response: web.StreamResponse, session: Session) -> None:
+        key: str | None = session.identity
+        if session.empty:
+            if key is not None:
+                await self._delete(request, key)
+            self.save_cookie(response, '', max_age=session.max_age)
+            return
+
+        if key is None:
+            key = uuid.uuid4().hex
+        await self._set(request, key, self._encoder(self._get_session_data(session)))
+        self.save_cookie(response, key, max_age=session.max_age)
+
+
+class MemoryStorage(_ServerSideStorage):
+    """ Сессии в памяти процесса: LRU с ограничением размера (каждый worker хранит свои сессии) """
+
+    def __init__(self, max_age: int, maxsize: int, **kwargs):
+        super().__init__(max_age=max_age, **kwargs)
+        self._sessions = TTLCache(maxsize=maxsize, ttl=max_age)
+
+    async def _get(self, request: web.Request, key: str) -> str | None:
+        data = self._sessions.get(key)
+        return None if data is MISSING else data
+
+    async def _set(self, request: web.Request, key: str, data: str) -> None:
+        self._sessions.set(key, data)
+
+    async def _delete(self, request: web.Request, key: str) -> None:
+        self._sessions.invalidate(key)
+
+
+class PostgresStorage(_ServerSideStorage):
+    """ Сессии в таблице http_sessions, общие для всех workers """
+
+    def __init__(self, max_age: int, sweep_interval: float = 600.0, **kwargs):
+        super().__init__(max_age=max_age, **kwargs)
+        self._sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+
+    async def _get(self, request: web.Request, key: str) -> str | None:
+        async with request.app['db'].connect() as connection:
+            return await SessionDAO(connection).get(key)
+
+    async def _set(self, request: web.Request, key: str, data: str) -> None:
+        now = time.monotonic()
+        async with request.app['db'].begin() as connection:
+            dao = SessionDAO(connection)
+            if now - self._last_sweep > self._sweep_interval:
+                self._last_sweep = now
+                await dao.delete_expired()
+            await dao.save(key, data, self.max_age)
+
+    async def _delete(self, request: web.Request, key: str) -> None:
+        async with request.app['db'].begin() as connection:
+            await SessionDAO(connection).delete(key)
+
+
+def _cookie_storage(options: dict) -> EncryptedCookieStorage:
+    secret_key: str | None = get_option(options, 'secret_key')
+    if secret_key is None:
+        # Sessions do not survive a restart and are not shared by workers
+        logger.warning('session.secret_key is not set, a random key is used')
+        secret_key = fernet.Fernet.generate_key().decode()
+    return EncryptedCookieStorage(
+        base64.urlsafe_b64decode(secret_key), max_age=get_option(options, 'max_age', None, int)
+    )
+
+
+def setup_session(application: web.Application) -> None:
+    options: dict = application['config'].get('session', {})
+    backend: str = get_option(options, 'backend', BACKEND_COOKIE)
+    if backend == BACKEND_NONE:
+        # Stateless mode: bearer tokens only, no session middleware at all
+        return
+
+    max_age: int = get_option(options, 'max_age', 86400, int)
+    if backend == BACKEND_MEMORY:
+        storage: AbstractStorage = MemoryStorage(max_age, get_option(options, 'maxsize', 10000, int))
+    elif backend == BACKEND_POSTGRES:
+        storage = PostgresStorage(max_age, get_option(options, 'sweep_interval', 600.0, float))
+    else:
+        storage = _cookie_storage(options)
+    aiohttp_session.setup(application, storage)
+
+
+async def start_session(request: web.Request) -> None:
+    """ Новая сессия при входе; в режиме без сессий ничего не делает """
+
+    if aiohttp_session.STORAGE_KEY in request:
+        await aiohttp_session.new_session(request)
+
+
+async def clear_session(request: web.Request) -> None:
+    if aiohttp_session.STORAGE_KEY in request:
+        session: Session = await aiohttp_session.get_session(request)
+        session.clear()
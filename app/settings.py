@@ -1,4 +1,5 @@
 import pathlib
+from typing import Any, Callable
 import yaml
 
 BASE_DIR = pathlib.Path(__file__).parent
@@ -11,4 +12,15 @@ def get_config(path):
     return config
 
 
+def get_option(options: dict | None, key: str, default: Any = None, cast: Callable | None = None) -> Any:
+    """ Возвращает значение параметра конфигурации (пустые значения после envsubst заменяются на default) """
+
+    value = (options or {}).get(key)
+    if value is None or value == '':
+        return default
+    if cast is bool and isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return cast(value) if cast else value
+
+
 config = get_config(config_path)
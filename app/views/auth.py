@@ -1,13 +1,28 @@
-import aiohttp_session
 from aiohttp import web
+from sqlalchemy.ext.asyncio import AsyncConnection
 
 from dao.role import RoleDAO
 from dao.user import UserDAO
+from middlewares import logout_claims
+from replicas import read_connection
 from services.auth import AuthService
 from services.pas import PasService
 from services.role import RoleService
+from services.token import TokenService
 from services.user import UserService
+from sessions import start_session, clear_session
 from settings import config
+from views.serializers import json_response
+
+
+def _auth_service(request: web.Request, connection: AsyncConnection) -> AuthService:
+    return AuthService(
+        config,
+        UserService(UserDAO(connection)),
+        RoleService(RoleDAO(connection)),
+        PasService(config),
+        TokenService(request.app['db']),
+    )
 
 
 class AuthView(web.View):
@@ -26,7 +41,7 @@ class AuthView(web.View):
                     description: Bad Request
             """
 
-        await aiohttp_session.new_session(self.request)
+        await start_session(self.request)
         data: dict = await self.request.json()
         username: str = data['username']
         password: str = data['password']
@@ -34,17 +49,17 @@ class AuthView(web.View):
         if None in [username, password]:
             assert web.HTTPBadRequest()
 
-        async with self.request.app['db'].connect() as connection:
-            role_dao = RoleDAO(connection)
-            user_dao = UserDAO(connection)
-            role_service = RoleService(role_dao)
-            user_service = UserService(user_dao)
-            pas_service = PasService(config)
-            auth_service = AuthService(config, user_service, role_service, pas_service)
+        # Throttled attempts are rejected before any lookup or hashing
+        await self.request.app['login_throttle'].check(username, self.request.remote)
 
-            tokens: dict = await auth_service.generate_tokens(data)
+        async with read_connection(self.request) as connection:
+            auth_service: AuthService = _auth_service(self.request, connection)
+            user: dict = await auth_service.check_credentials(data)
 
-        return web.json_response(data=tokens, status=201)
+        # The read connection is back in the pool before the refresh token is written on the primary
+        tokens: dict = await auth_service.issue_tokens(user)
+
+        return json_response(data=tokens, status=201)
 
     async def put(self):
         """
@@ -61,28 +76,30 @@ class AuthView(web.View):
                 description: Bad Request
         """
 
-        await aiohttp_session.new_session(self.request)
+        await start_session(self.request)
         data: dict = await self.request.json()
         refresh_token: str = data.get('refresh_token', None)
         if not refresh_token:
             assert web.HTTPBadRequest()
 
-        async with self.request.app['db'].connect() as connection:
-            role_dao = RoleDAO(connection)
-            user_dao = UserDAO(connection)
-            role_service = RoleService(role_dao)
-            user_service = UserService(user_dao)
-            pas_service = PasService(config)
-            auth_service = AuthService(config, user_service, role_service, pas_service)
+        async with read_connection(self.request) as connection:
+            auth_service: AuthService = _auth_service(self.request, connection)
+            claims: dict = await auth_service.decode_refresh_token(refresh_token)
+            user: dict = await auth_service.check_credentials(claims, is_refresh=True)
 
-            tokens: dict = await auth_service.approve_refresh_token(refresh_token)
+        # Rotation and the new refresh token use their own primary transactions, never while holding a read connection
+        family: str = await auth_service.rotate_refresh_token(claims)
+        tokens: dict = await auth_service.issue_tokens(user, family)
 
-        return web.json_response(data=tokens, status=201)
+        return json_response(data=tokens, status=201)
 
 
 async def logout(request: web.Request) -> web.Response:
-    """ Logout. Clear session """
+    """ Выход: отзыв семейства bearer-токена (в том числе истёкшего) и очистка сессии """
+
+    claims: dict | None = logout_claims(request)
+    if claims and claims.get('fam'):
+        await TokenService(request.app['db']).revoke(claims['fam'])
 
-    session = await aiohttp_session.get_session(request)
-    session.clear()
+    await clear_session(request)
     return web.HTTPSeeOther(location='/login')
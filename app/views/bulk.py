@@ -0,0 +1,305 @@
+import asyncio
+import csv
+import io
+import json
+from contextlib import aclosing
+from datetime import datetime, timezone
+from typing import AsyncIterator
+
+from aiohttp import web
+from aiohttp.streams import StreamReader
+from aiohttp.web_request import Request
+from pydantic import ValidationError
+
+from dao.role import RoleDAO
+from dao.user import UserDAO
+from deadline import with_deadline
+from middlewares import admin_required
+from replicas import read_connection
+from views.models import UserRegisterModel
+from views.serializers import dumps_lines
+from services.pas import PasService
+from services.role import RoleService
+from services.user import UserService
+from settings import config
+
+NDJSON = 'application/x-ndjson'
+CSV = 'text/csv'
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FIELDS = ['id', 'first_name', 'last_name', 'username', 'date_of_birth', 'created', 'roles_id', 'role']
+
+
+async def _skip_line(content: StreamReader) -> None:
+    while True:
+        try:
+            await content.readline()
+            return
+        except ValueError:
+            continue
+
+
+async def _read_lines(request: Request) -> AsyncIterator[tuple[int, str | None]]:
+    """ Строки тела запроса с номерами; None, если строка длиннее буфера потока или не в UTF-8 """
+
+    line_no = 0
+    while True:
+        try:
+            raw_line: bytes = await request.content.readline()
+        except ValueError:
+            # Longer than the stream buffer: the rest of the line is skipped
+            line_no += 1
+            await _skip_line(request.content)
+            yield line_no, None
+            continue
+        if not raw_line:
+            return
+
+        line_no += 1
+        try:
+            line: str = raw_line.decode('utf-8')
+        except UnicodeDecodeError:
+            yield line_no, None
+            continue
+        yield line_no, line
+
+
+async def _read_rows(request: Request) -> AsyncIterator[tuple[int, dict | None]]:
+    """ Читает тело запроса построчно: (номер строки, данные или None, если строку не разобрать) """
+
+    is_csv: bool = request.content_type == CSV
+    header: list[str] | None = None
+    # Lines of a CSV record whose quoted field spans line breaks
+    record: list[str] = []
+    record_line = 0
+    quotes = 0
+
+    async for line_no, line in _read_lines(request):
+        if line is None:
+            # Reported as an invalid row; the rest of the stream is still imported
+            yield (record_line if record else line_no), None
+            record, quotes = [], 0
+            continue
+
+        if not is_csv:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                item = None
+            yield line_no, item if isinstance(item, dict) else None
+            continue
+
+        if not record:
+            record_line = line_no
+        record.append(line)
+        # Quotes inside a quoted field are doubled: an odd count means the field goes on
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+
+        text: str = ''.join(record)
+        record, quotes = [], 0
+        if not text.strip():
+            continue
+        values: list[str] = next(csv.reader(io.StringIO(text, newline='')))
+        if header is None:
+            header = values
+            continue
+        yield record_line, dict(zip(header, values))
+
+    if record:
+        # A quoted field is not closed before the end of the stream
+        yield record_line, None
+
+
+async def _import_batch(request: Request, batch: list[tuple[int, dict | None]]) -> list[dict]:
+    results: dict[int, dict] = {}
+    valid: list[tuple[int, dict]] = []
+    seen: set[str] = set()
+
+    for line_no, item in batch:
+        try:
+            data: dict = UserRegisterModel.validate(item).dict()
+        except (ValidationError, TypeError):
+            results[line_no] = {'line': line_no, 'status': 'error', 'error': 'invalid'}
+            continue
+        if data['username'] in seen:
+            results[line_no] = {'line': line_no, 'status': 'error', 'error': 'duplicate'}
+            continue
+        seen.add(data['username'])
+        valid.append((line_no, data))
+
+    if valid:
+        # Existing usernames are rejected before the hashing cost is paid
+        async with request.app['db'].connect() as connection:
+            user_service = UserService(UserDAO(connection))
+            existing: set[str] = await user_service.get_existing_usernames([data['username'] for _, data in valid])
+        for line_no, data in valid:
+            if data['username'] in existing:
+                results[line_no] = {'line': line_no, 'status': 'error', 'error': 'duplicate'}
+        valid = [(line_no, data) for line_no, data in valid if data['username'] not in existing]
+
+    if valid:
+        pas_service = PasService(config)
+        passwords: list[str] = await asyncio.gather(
+            *(pas_service.encode_password(data['password']) for _, data in valid)
+        )
+
+        async with request.app['db'].begin() as connection:
+            role_service = RoleService(RoleDAO(connection))
+            user_service = UserService(UserDAO(connection))
+
+            roles_ids = await role_service.bulk_create(len(valid))
+            rows: list[dict] = [
+                {'username': data['username'], 'password': password, 'roles_id': roles_id}
+                for (_, data), password, roles_id in zip(valid, passwords, roles_ids)
+            ]
+            created: dict[str, int] = await user_service.bulk_create(rows)
+
+            # Usernames taken concurrently since the check above leave their roles unused
+            orphans: list[int] = [row['roles_id'] for row in rows if row['username'] not in created]
+            if orphans:
+                await role_service.delete_uncommitted(orphans)
+
+        for line_no, data in valid:
+            if data['username'] in created:
+                results[line_no] = {'line': line_no, 'status': 'created', 'id': created[data['username']]}
+            else:
+                results[line_no] = {'line': line_no, 'status': 'error', 'error': 'duplicate'}
+
+    return [results[line_no] for line_no in sorted(results)]
+
+
+@admin_required
+@with_deadline(None)
+async def users_bulk_import(request: Request) -> web.StreamResponse:
+    """
+    ---
+    description: Create users from an NDJSON or CSV (header line required) stream of {username, password}.
+    tags:
+    - Users
+    consumes:
+    - application/x-ndjson
+    - text/csv
+    produces:
+    - application/x-ndjson
+    responses:
+        "200":
+            description: Successful operation. Returns one result line per input row
+        "415":
+            description: Unsupported Media Type
+    """
+    if request.content_type not in (NDJSON, CSV):
+        raise web.HTTPUnsupportedMediaType()
+
+    response = web.StreamResponse(status=200, headers={'Content-Type': NDJSON})
+    await response.prepare(request)
+
+    batch: list[tuple[int, dict | None]] = []
+    created = 0
+    try:
+        async for row in _read_rows(request):
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                results = await _import_batch(request, batch)
+                created += sum(result['status'] == 'created' for result in results)
+                await response.write(dumps_lines(results))
+                batch = []
+
+        if batch:
+            results = await _import_batch(request, batch)
+            created += sum(result['status'] == 'created' for result in results)
+            await response.write(dumps_lines(results))
+    finally:
+        if created:
+            # Every created user has a new role: other workers drop their role list once per import
+            async with request.app['db'].begin() as connection:
+                await RoleService(RoleDAO(connection)).invalidate_list()
+
+    await response.write_eof()
+    return response
+
+
+def _encode_csv(rows: list[dict], with_header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    if with_header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+@admin_required
+@with_deadline(None)
+async def users_export(request: Request) -> web.StreamResponse:
+    """
+    ---
+    description: Export users with their role as NDJSON or CSV. Supports gzip and incremental pulls (since).
+    tags:
+    - Users
+    parameters:
+    - in: query
+      name: format
+      type: string
+      enum: [ndjson, csv]
+    - in: query
+      name: since
+      type: string
+      format: date-time
+    - in: query
+      name: gzip
+      type: boolean
+    produces:
+    - application/x-ndjson
+    - text/csv
+    responses:
+        "200":
+            description: Successful operation
+        "400":
+            description: Bad Request
+    """
+    export_format: str = request.query.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        raise web.HTTPBadRequest()
+
+    since: datetime | None = None
+    if request.query.get('since'):
+        try:
+            since = datetime.fromisoformat(request.query['since'])
+        except ValueError:
+            raise web.HTTPBadRequest()
+        if since.tzinfo is not None:
+            # users.created is a naive UTC timestamp
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+
+    async with read_connection(request) as connection:
+        user_service = UserService(UserDAO(connection))
+        async with aclosing(user_service.iter_with_roles(EXPORT_BATCH_SIZE, since)) as batches:
+            # The query runs before the status line is sent, so its errors still get a proper status
+            users: list[dict] | None = await anext(batches, None)
+
+            response = web.StreamResponse(
+                status=200, headers={'Content-Type': CSV if export_format == 'csv' else NDJSON}
+            )
+            if request.query.get('gzip', '').lower() in ('1', 'true', 'yes'):
+                response.enable_compression(web.ContentCoding.gzip)
+            await response.prepare(request)
+
+            with_header = True
+            while users is not None:
+                if export_format == 'csv':
+                    chunk = _encode_csv(users, with_header).encode('utf-8')
+                    with_header = False
+                else:
+                    chunk = dumps_lines(users)
+                await response.write(chunk)
+                users = await anext(batches, None)
+
+        if export_format == 'csv' and with_header:
+            await response.write(_encode_csv([], with_header).encode('utf-8'))
+
+    await response.write_eof()
+    return response
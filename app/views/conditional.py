@@ -0,0 +1,26 @@
+from aiohttp import web
+
+
+def make_etag(*parts: object) -> str:
+    """ Сильный ETag из идентификатора ресурса и версии его строки """
+
+    return '"' + '.'.join(str(part) for part in parts) + '"'
+
+
+def is_conditional(request: web.Request) -> bool:
+    """ Запрос с If-None-Match: только тогда имеет смысл сначала читать версию """
+
+    return bool(request.headers.get('If-None-Match'))
+
+
+def check_not_modified(request: web.Request, etag: str) -> None:
+    """ 304 Not Modified, если If-None-Match содержит текущий ETag ресурса """
+
+    header: str | None = request.headers.get('If-None-Match')
+    if not header:
+        return
+
+    # If-None-Match uses the weak comparison (RFC 9110, 13.1.2)
+    tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    if '*' in tags or etag in tags:
+        raise web.HTTPNotModified(headers={'ETag': etag})
@@ -3,8 +3,11 @@ from aiohttp_pydantic import PydanticView
 
 from dao.role import RoleDAO
 from middlewares import admin_required
-from views.models import RoleModel, RoleRetrieveModel
-from services.role import RoleService
+from replicas import read_connection
+from views.models import RoleModel
+from views.conditional import make_etag, check_not_modified, is_conditional
+from views.serializers import json_response, serialize_role
+from services.role import RoleService, collection_version
 
 
 @admin_required
@@ -20,15 +23,21 @@ class RolesCollectView(PydanticView):
         responses:
             "200":
                 description: Successful operation
+            "304":
+                description: Not Modified (If-None-Match matches the current ETag)
         """
-        async with self.request.app['db'].connect() as connection:
+        async with read_connection(self.request) as connection:
             role_dao = RoleDAO(connection)
             role_service = RoleService(role_dao)
 
+            if is_conditional(self.request):
+                check_not_modified(self.request, make_etag('roles', await role_service.get_collection_version()))
+
             roles: list[dict] = await role_service.get_all()
-            roles = [RoleRetrieveModel.validate(role).dict() for role in roles]
+            etag: str = make_etag('roles', collection_version(roles))
+            roles = [serialize_role(role) for role in roles]
 
-            return web.json_response(data={'status': 'OK', 'roles': roles}, status=200)
+            return json_response(data={'status': 'OK', 'roles': roles}, headers={'ETag': etag}, status=200)
 
     async def post(self, role: RoleModel) -> web.Response:
         """
@@ -52,9 +61,9 @@ class RolesCollectView(PydanticView):
             created_role: dict | None = await role_service.create(data)
             if not created_role:
                 raise web.HTTPBadRequest()
-            created_role = RoleRetrieveModel.validate(created_role).dict()
+            created_role = serialize_role(created_role)
 
-            return web.json_response(
+            return json_response(
                 data={'status': 'Created', 'data': created_role},
                 headers={'Location': str(self.request.url.joinpath(f'{created_role["id"]}'))},
                 status=201
@@ -74,20 +83,29 @@ class RoleItemView(PydanticView):
         responses:
             "200":
                 description: Successful operation
+            "304":
+                description: Not Modified (If-None-Match matches the current ETag)
             "404":
                 description: Not Found
         """
         role_id = rid
-        async with self.request.app['db'].connect() as connection:
+        async with read_connection(self.request) as connection:
             role_dao = RoleDAO(connection)
             role_service = RoleService(role_dao)
 
+            if is_conditional(self.request):
+                version: int | None = await role_service.get_version(role_id)
+                if version is None:
+                    raise web.HTTPNotFound
+                check_not_modified(self.request, make_etag('role', role_id, version))
+
             role_data: dict | None = await role_service.get_by_id(role_id)
             if not role_data:
                 raise web.HTTPNotFound
-            role_data = RoleRetrieveModel.validate(role_data).dict()
+            etag: str = make_etag('role', role_id, role_data['version'])
+            role_data = serialize_role(role_data)
 
-            return web.json_response(data={'status': 'OK', 'data': role_data}, status=200)
+            return json_response(data={'status': 'OK', 'data': role_data}, headers={'ETag': etag}, status=200)
 
     async def patch(self, rid: int, /, role: RoleModel) -> web.Response:
         """
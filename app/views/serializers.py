@@ -0,0 +1,47 @@
+import datetime
+import json
+from typing import Any, Iterable, Mapping
+
+from aiohttp import web
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+USER_FIELDS = ('id', 'first_name', 'last_name', 'username', 'date_of_birth', 'roles_id')
+ROLE_FIELDS = ('id', 'role')
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(data: Any) -> bytes:
+    """ Сериализация в JSON: orjson, если установлен, иначе стандартный json """
+
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_lines(rows: Iterable[Any]) -> bytes:
+    """ Сериализация в NDJSON (одна строка на объект) """
+
+    return b''.join(dumps(row) + b'\n' for row in rows)
+
+
+def json_response(data: Any, status: int = 200, headers: Mapping[str, str] | None = None) -> web.Response:
+    return web.Response(body=dumps(data), status=status, headers=headers, content_type='application/json')
+
+
+def serialize_user(data: Mapping[str, Any]) -> dict[str, Any]:
+    """ Публичные поля пользователя (без пароля) из строки БД или словаря сервиса """
+
+    return {field: data[field] for field in USER_FIELDS}
+
+
+def serialize_role(data: Mapping[str, Any]) -> dict[str, Any]:
+    return {field: data[field] for field in ROLE_FIELDS}
@@ -0,0 +1,76 @@
+from aiohttp import web
+from aiohttp.web_request import Request
+
+from dao.database.schemas import pool_stats
+from middlewares import admin_required, token_cache
+from services.role import role_cache, role_flight
+from services.user import user_flight
+from views.serializers import json_response
+
+
+@admin_required
+async def pool_status(request: Request) -> web.Response:
+    """
+    ---
+    description: Get connection pool usage (checked-in / checked-out connections) and replica health.
+    tags:
+    - Status
+    produces:
+    - application/json
+    responses:
+        "200":
+            description: Successful operation
+    """
+    return json_response(data={
+        'status': 'OK',
+        'pool': pool_stats(request.app['db']),
+        'replicas': [
+            {**replica, 'pool': pool_stats(engine)}
+            for replica, engine in zip(request.app['db_router'].replicas(), request.app['db_replicas'])
+        ],
+    }, status=200)
+
+
+@admin_required
+async def cache_status(request: Request) -> web.Response:
+    """
+    ---
+    description: Get in-process cache statistics (hits / misses) and in-flight coalesced lookups.
+    tags:
+    - Status
+    produces:
+    - application/json
+    responses:
+        "200":
+            description: Successful operation
+    """
+    return json_response(data={
+        'status': 'OK',
+        'roles': role_cache.stats(),
+        'tokens': token_cache.stats(),
+        'singleflight': {'users': user_flight.stats(), 'roles': role_flight.stats()},
+    }, status=200)
+
+
+@admin_required
+async def sql_profiles(request: Request) -> web.Response:
+    """
+    ---
+    description: SQL statements and timings of recent requests sent with the X-SQL-Profile header.
+    tags:
+    - Status
+    produces:
+    - application/json
+    parameters:
+    - in: query
+      name: request_id
+      type: string
+      required: false
+      description: Value of the X-Request-Id response header
+    responses:
+        "200":
+            description: Successful operation
+    """
+    request_id: str | None = request.query.get('request_id')
+    profiles = [p for p in request.app['querylog'].recent if request_id in (None, p['request_id'])]
+    return json_response(data={'status': 'OK', 'profiles': profiles}, status=200)
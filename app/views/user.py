@@ -4,11 +4,19 @@ from aiohttp_pydantic import PydanticView
 
 from dao.role import RoleDAO
 from dao.user import UserDAO
+from deadline import clear_deadline
 from middlewares import owner_or_admin_required, admin_required
-from views.models import UserRegisterModel, UserEditModel, UserRetrieveModel
+from replicas import read_connection
+from views.models import UserRegisterModel, UserEditModel
+from views.conditional import make_etag, check_not_modified, is_conditional
+from views.serializers import json_response, dumps_lines, serialize_user
 from services.role import RoleService
 from services.user import UserService
 
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+
 
 async def user_register(request: Request) -> web.Response:
     """
@@ -33,47 +41,65 @@ async def user_register(request: Request) -> web.Response:
         role_service = RoleService(role_dao)
         user_service = UserService(user_dao)
 
-        created_role: dict | None = await role_service.create()
-        if not created_role:
-            raise web.HTTPBadRequest()
-
-        roles_id = created_role['id']
-        data['roles_id'] = roles_id
-
-        created_user: dict | None = await user_service.create(data)
+        created_user: dict | None = await user_service.create_with_role(data)
         if not created_user:
             raise web.HTTPBadRequest()
-        created_user = UserRetrieveModel.validate(created_user).dict()
 
-        return web.json_response(
-            data={'status': 'Created', 'data': created_user},
-            headers={'Location': str(request.url.joinpath(f'{created_user["id"]}'))},
-            status=201
-        )
+    # The new role changes the role list; dropped after commit so a concurrent read cannot re-cache the old one
+    role_service.invalidate_local()
+    created_user = serialize_user(created_user)
+
+    return json_response(
+        data={'status': 'Created', 'data': created_user},
+        headers={'Location': str(request.url.joinpath(f'{created_user["id"]}'))},
+        status=201
+    )
 
 
 @admin_required
 class UsersCollectView(PydanticView):
-    async def get(self) -> web.Response:
+    async def get(self, limit: int = PAGE_SIZE, after: int | None = None,
+                  stream: bool = False) -> web.StreamResponse:
         """
         ---
-        description: Get list of users.
+        description: Get list of users. Keyset pagination by id (limit, after) or NDJSON stream (stream=true).
         tags:
         - Users
         produces:
         - application/json
+        - application/x-ndjson
         responses:
             "200":
                 description: Successful operation
         """
-        async with self.request.app['db'].connect() as connection:
+        if stream:
+            return await self._stream()
+
+        limit = min(max(limit, 1), MAX_PAGE_SIZE)
+        async with read_connection(self.request) as connection:
             user_dao = UserDAO(connection)
             user_service = UserService(user_dao)
 
-            users: list[dict] = await user_service.get_all()
-            users = [UserRetrieveModel.validate(user).dict() for user in users]
+            users: list[dict] = await user_service.get_page(limit, after)
+            users = [serialize_user(user) for user in users]
+            next_after: int | None = users[-1]['id'] if len(users) == limit else None
 
-            return web.json_response(data={'status': 'OK', 'users': users}, status=200)
+            return json_response(data={'status': 'OK', 'users': users, 'next_after': next_after}, status=200)
+
+    async def _stream(self) -> web.StreamResponse:
+        clear_deadline(self.request)
+        response = web.StreamResponse(status=200, headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(self.request)
+
+        async with read_connection(self.request) as connection:
+            user_dao = UserDAO(connection)
+            user_service = UserService(user_dao)
+
+            async for users in user_service.iter_all(STREAM_BATCH_SIZE):
+                await response.write(dumps_lines(serialize_user(user) for user in users))
+
+        await response.write_eof()
+        return response
 
     async def post(self, user: UserRegisterModel) -> web.Response:
         """
@@ -97,23 +123,19 @@ class UsersCollectView(PydanticView):
             user_service = UserService(user_dao)
             role_service = RoleService(role_dao)
 
-            created_role: dict | None = await role_service.create()
-            if not created_role:
-                raise web.HTTPBadRequest()
-
-            roles_id = created_role['id']
-            data['roles_id'] = roles_id
-
-            created_user: dict | None = await user_service.create(data)
+            created_user: dict | None = await user_service.create_with_role(data)
             if not created_user:
                 raise web.HTTPBadRequest()
-            created_user = UserRetrieveModel.validate(created_user).dict()
 
-            return web.json_response(
-                data={'status': 'Created', 'data': created_user},
-                headers={'Location': str(self.request.url.joinpath(f'{created_user["id"]}'))},
-                status=201
-            )
+        # The new role changes the role list; dropped after commit so a concurrent read cannot re-cache the old one
+        role_service.invalidate_local()
+        created_user = serialize_user(created_user)
+
+        return json_response(
+            data={'status': 'Created', 'data': created_user},
+            headers={'Location': str(self.request.url.joinpath(f'{created_user["id"]}'))},
+            status=201
+        )
 
 
 @owner_or_admin_required
@@ -129,21 +151,31 @@ class UserItemView(PydanticView):
         responses:
             "200":
                 description: Successful operation
+            "304":
+                description: Not Modified (If-None-Match matches the current ETag)
             "404":
                 description: Not Found
         """
         user_id = uid
-        async with self.request.app['db'].connect() as connection:
+        async with read_connection(self.request) as connection:
             user_dao = UserDAO(connection)
             user_service = UserService(user_dao)
 
+            # A conditional request reads only the version column first; a match ends with 304
+            if is_conditional(self.request):
+                version: int | None = await user_service.get_version(user_id)
+                if version is None:
+                    raise web.HTTPNotFound()
+                check_not_modified(self.request, make_etag('user', user_id, version))
+
             user_data: dict | None = await user_service.get_by_id(user_id)
             if not user_data:
                 raise web.HTTPNotFound()
 
-            user_data = UserRetrieveModel.validate(user_data).dict()
+            etag: str = make_etag('user', user_id, user_data['version'])
+            user_data = serialize_user(user_data)
 
-            return web.json_response(data={'status': 'OK', 'data': user_data}, status=200)
+            return json_response(data={'status': 'OK', 'data': user_data}, headers={'ETag': etag}, status=200)
 
     async def patch(self, uid: int, /, user: UserEditModel) -> web.Response:
         """
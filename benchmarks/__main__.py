@@ -0,0 +1,52 @@
+import argparse
+import json
+
+from benchmarks import common
+
+WORKLOADS = ['login', 'refresh', 'list', 'user_crud']
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Load tests and micro-benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    micro = commands.add_parser('micro', help='micro-benchmarks (no database required)')
+    micro.add_argument('--iterations', type=int, default=1000)
+    micro.add_argument('--hash-iterations', type=int, default=50, help='compare_passwords calls')
+    micro.add_argument('--rows', type=int, default=1000, help='rows for get_all/serialization')
+    micro.add_argument('--output', help='result file (default: benchmarks/results/micro-<commit>.json)')
+
+    load = commands.add_parser('load', help='HTTP load test against the app and a local PostgreSQL')
+    load.add_argument('--concurrency', type=int, default=16)
+    load.add_argument('--requests', type=int, default=1000, help='requests per workload')
+    load.add_argument('--workload', action='append', choices=WORKLOADS, help='repeatable, default: all')
+    load.add_argument('--port', type=int, default=8089)
+    load.add_argument('--output', help='result file (default: benchmarks/results/load-<commit>.json)')
+
+    diff = commands.add_parser('compare', help='compare two result files')
+    diff.add_argument('base')
+    diff.add_argument('head')
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+
+    if args.command == 'compare':
+        common.compare(args.base, args.head)
+        return
+
+    if args.command == 'micro':
+        from benchmarks import micro
+        results = micro.main(args.iterations, args.hash_iterations, args.rows)
+    else:
+        from benchmarks import load
+        results = load.main(args.concurrency, args.requests, args.workload or WORKLOADS, args.port)
+
+    print(json.dumps(results, indent=2))
+    print(f'Saved to {common.save_results(args.command, results, args.output)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable
+
+ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+APP_DIR = ROOT_DIR / 'app'
+
+# The application uses imports relative to app/ (as when started with `python3 main.py`)
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """ p50/p95/p99 (nearest rank) в миллисекундах """
+
+    if not samples:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+        return round(ordered[index] * 1000, 3)
+
+    return {'p50_ms': rank(50), 'p95_ms': rank(95), 'p99_ms': rank(99), 'max_ms': round(ordered[-1] * 1000, 3)}
+
+
+def summarize(samples: list[float], elapsed: float, errors: int = 0) -> dict[str, Any]:
+    return {
+        'count': len(samples),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        **percentiles(samples),
+    }
+
+
+async def measure_async(func: Callable[[], Awaitable[Any]], iterations: int, warmup: int = 10) -> dict[str, Any]:
+    for _ in range(warmup):
+        await func()
+
+    samples: list[float] = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - t)
+    return summarize(samples, time.perf_counter() - started)
+
+
+def measure(func: Callable[[], Any], iterations: int, warmup: int = 10) -> dict[str, Any]:
+    for _ in range(warmup):
+        func()
+
+    samples: list[float] = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - t)
+    return summarize(samples, time.perf_counter() - started)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(kind: str, results: dict[str, Any], path: str | None) -> pathlib.Path:
+    commit = _git_commit()
+    output = pathlib.Path(path) if path else ROOT_DIR / 'benchmarks' / 'results' / f'{kind}-{commit or "unknown"}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        'kind': kind,
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'results': results,
+    }, indent=2))
+    return output
+
+
+def compare(base_path: str, head_path: str) -> None:
+    """ Печатает изменения p50/p99/throughput между двумя файлами результатов """
+
+    base = json.loads(pathlib.Path(base_path).read_text())['results']
+    head = json.loads(pathlib.Path(head_path).read_text())['results']
+    print(f'{"benchmark":<32} {"metric":<16} {"base":>12} {"head":>12} {"change":>9}')
+    for name in sorted(set(base) & set(head)):
+        for metric in ('p50_ms', 'p99_ms', 'throughput_rps'):
+            old, new = base[name].get(metric), head[name].get(metric)
+            if old is None or new is None:
+                continue
+            change = f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+            print(f'{name:<32} {metric:<16} {old:>12} {new:>12} {change:>9}')
@@ -0,0 +1,124 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+from aiohttp import web
+
+from benchmarks.common import summarize
+from main import create_app
+from settings import config
+
+_Step = Callable[[aiohttp.ClientSession, int], Awaitable[bool]]
+
+
+class LoadRunner:
+    """ Запускает приложение через setup_app и нагружает его HTTP-запросами с фиксированной конкурентностью """
+
+    def __init__(self, concurrency: int, requests: int, port: int = 8089):
+        self._concurrency = concurrency
+        self._requests = requests
+        self._port = port
+        self._base_url = f'http://127.0.0.1:{port}'
+        self._admin = {
+            'username': str(config['common']['admin_username']),
+            'password': str(config['common']['admin_password']),
+        }
+        self._headers: dict[str, str] = {}
+        self._refresh_tokens: list[str] = []
+
+    async def _login(self, session: aiohttp.ClientSession, i: int) -> bool:
+        async with session.post('/login', json=self._admin) as response:
+            await response.read()
+            return response.status == 201
+
+    async def _new_refresh_token(self, session: aiohttp.ClientSession) -> str:
+        async with session.post('/login', json=self._admin) as response:
+            return (await response.json())['refresh_token']
+
+    async def _refresh(self, session: aiohttp.ClientSession, i: int) -> bool:
+        # Refresh tokens are single-use: every concurrent client follows its own rotation chain
+        token: str = self._refresh_tokens.pop()
+        async with session.put('/login', json={'refresh_token': token}) as response:
+            if response.status != 201:
+                await response.read()
+                self._refresh_tokens.append(await self._new_refresh_token(session))
+                return False
+            self._refresh_tokens.append((await response.json())['refresh_token'])
+            return True
+
+    async def _list(self, session: aiohttp.ClientSession, i: int) -> bool:
+        async with session.get('/users', params={'limit': 100}, headers=self._headers) as response:
+            await response.read()
+            return response.status == 200
+
+    async def _user_crud(self, session: aiohttp.ClientSession, i: int) -> bool:
+        user = {'username': f'bench_{uuid.uuid4().hex}', 'password': 'benchmark'}
+        async with session.post('/users', json=user, headers=self._headers) as response:
+            if response.status != 201:
+                return False
+            uid: int = (await response.json())['data']['id']
+        async with session.get(f'/users/{uid}', headers=self._headers) as response:
+            await response.read()
+            ok = response.status == 200
+        async with session.patch(f'/users/{uid}', json={'first_name': 'Bench'}, headers=self._headers) as response:
+            ok = ok and response.status == 204
+        async with session.delete(f'/users/{uid}', headers=self._headers) as response:
+            return ok and response.status == 204
+
+    async def _run_workload(self, session: aiohttp.ClientSession, step: _Step) -> dict[str, Any]:
+        samples: list[float] = []
+        errors = 0
+        counter = iter(range(self._requests))
+
+        async def worker() -> None:
+            nonlocal errors
+            for i in counter:
+                started = time.perf_counter()
+                try:
+                    ok = await step(session, i)
+                except aiohttp.ClientError:
+                    ok = False
+                samples.append(time.perf_counter() - started)
+                if not ok:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self._concurrency)))
+        return summarize(samples, time.perf_counter() - started, errors)
+
+    async def run(self, workloads: list[str]) -> dict[str, Any]:
+        runner = web.AppRunner(create_app())
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', self._port)
+        await site.start()
+
+        steps: dict[str, _Step] = {
+            'login': self._login,
+            'refresh': self._refresh,
+            'list': self._list,
+            'user_crud': self._user_crud,
+        }
+        results: dict[str, Any] = {}
+        try:
+            connector = aiohttp.TCPConnector(limit=self._concurrency)
+            async with aiohttp.ClientSession(self._base_url, connector=connector) as session:
+                async with session.post('/login', json=self._admin) as response:
+                    tokens: dict = await response.json()
+                self._headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+                if 'refresh' in workloads:
+                    self._refresh_tokens = [
+                        await self._new_refresh_token(session) for _ in range(self._concurrency)
+                    ]
+
+                for name in workloads:
+                    results[f'http.{name}[c={self._concurrency}]'] = await self._run_workload(session, steps[name])
+        finally:
+            await runner.cleanup()
+
+        return results
+
+
+def main(concurrency: int, requests: int, workloads: list[str], port: int) -> dict[str, Any]:
+    return asyncio.run(LoadRunner(concurrency, requests, port).run(workloads))
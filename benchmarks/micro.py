@@ -0,0 +1,93 @@
+import asyncio
+import collections
+import datetime
+import itertools
+from typing import Any
+
+import jwt
+
+from benchmarks.common import measure, measure_async
+from services.auth import AuthService
+from services.pas import PasService
+from services.user import UserService
+from settings import config
+from views.serializers import dumps, serialize_user
+
+UserRow = collections.namedtuple(
+    'UserRow', 'id first_name last_name username password date_of_birth created roles_id'
+)
+
+
+def _rows(count: int) -> list[UserRow]:
+    created = datetime.datetime(2023, 1, 1)
+    return [
+        UserRow(i, f'First{i}', f'Last{i}', f'user{i}', 'x' * 44, None, created, i)
+        for i in range(1, count + 1)
+    ]
+
+
+class _RowsDAO:
+    """ Возвращает заготовленные строки вместо запроса к PostgreSQL """
+
+    def __init__(self, rows: list[UserRow]):
+        self._rows = rows
+
+    async def get_all(self) -> list[UserRow]:
+        return self._rows
+
+
+class _UserLookup:
+    """ Заменяет UserService в AuthService, чтобы измерялась только генерация токенов """
+
+    async def get_by_username_with_role(self, username: str) -> dict[str, Any]:
+        return {'id': 1, 'username': username, 'password': '', 'roles_id': 1, 'role': 'admin'}
+
+
+class _TokenStore:
+    """ Заменяет TokenService: id refresh-токенов выдаются без записи в PostgreSQL """
+
+    def __init__(self):
+        self._next_id = itertools.count(1)
+
+    def new_id(self) -> str:
+        return f'{next(self._next_id):032x}'
+
+    async def issue(self, user_id: int, family: str, expires: datetime.datetime) -> str:
+        return self.new_id()
+
+
+async def run_micro(iterations: int = 1000, hash_iterations: int = 50, rows: int = 1000) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    options: dict = config['jwt']
+
+    pas_service = PasService(config)
+    password_hash: str = await pas_service.encode_password('benchmark')
+    results['pas.compare_passwords'] = await measure_async(
+        lambda: pas_service.compare_passwords(password_hash, 'benchmark'), hash_iterations, warmup=2,
+    )
+
+    auth_service = AuthService(config, _UserLookup(), None, pas_service, _TokenStore())
+    results['auth.generate_tokens'] = await measure_async(
+        lambda: auth_service.generate_tokens({'username': 'admin'}, is_refresh=True), iterations,
+    )
+
+    tokens: dict = await auth_service.generate_tokens({'username': 'admin'}, is_refresh=True)
+    results['jwt.decode'] = measure(
+        lambda: jwt.decode(jwt=tokens['access_token'], key=options['secret'], algorithms=[options['algorithm']]),
+        iterations,
+    )
+
+    user_service = UserService(_RowsDAO(_rows(rows)))
+    results[f'user.get_all[{rows}]'] = await measure_async(user_service.get_all, max(10, iterations // 10))
+
+    users: list[dict] = await user_service.get_all()
+    results[f'serialize.users[{rows}]'] = measure(
+        lambda: dumps({'status': 'OK', 'users': [serialize_user(user) for user in users]}),
+        max(10, iterations // 10),
+    )
+
+    return results
+
+
+def main(iterations: int, hash_iterations: int, rows: int) -> dict[str, Any]:
+    return asyncio.run(run_micro(iterations, hash_iterations, rows))
@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+
+from admission import AdmissionController, _Gate, CLASS_AUTH, CLASS_READ, CLASS_WRITE
+
+
+class GateTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_admits_up_to_limit(self):
+        gate = _Gate('read', limit=2, max_queue=0, queue_timeout=1.0)
+
+        self.assertIsNone(await gate.acquire())
+        self.assertIsNone(await gate.acquire())
+        self.assertEqual(gate.in_flight, 2)
+
+    async def test_rejects_when_queue_is_full(self):
+        gate = _Gate('read', limit=1, max_queue=1, queue_timeout=1.0)
+        await gate.acquire()
+        queued = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+
+        self.assertEqual(gate.queued, 1)
+        self.assertEqual(await gate.acquire(), 'queue_full')
+
+        gate.release()
+        self.assertIsNone(await queued)
+        self.assertEqual((gate.in_flight, gate.queued), (1, 0))
+
+    async def test_rejects_after_queue_timeout(self):
+        gate = _Gate('read', limit=1, max_queue=10, queue_timeout=0.01)
+        await gate.acquire()
+
+        self.assertEqual(await gate.acquire(), 'queue_timeout')
+        self.assertEqual((gate.in_flight, gate.queued), (1, 0))
+
+    async def test_release_admits_waiting_request(self):
+        gate = _Gate('read', limit=1, max_queue=10, queue_timeout=1.0)
+        await gate.acquire()
+        waiting = [asyncio.create_task(gate.acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        gate.release()
+        done, pending = await asyncio.wait(waiting, timeout=0.1)
+        self.assertEqual((len(done), len(pending)), (1, 1))
+        self.assertEqual((gate.in_flight, gate.queued), (1, 1))
+
+        gate.release()
+        await asyncio.gather(*pending)
+        self.assertEqual((gate.in_flight, gate.queued), (1, 0))
+
+
+class AdmissionControllerTest(unittest.TestCase):
+
+    def test_limits_from_config(self):
+        controller = AdmissionController({'admission': {'auth_limit': '4', 'read_limit': '', 'max_queue': 7}})
+
+        self.assertEqual(controller.gate(CLASS_AUTH).limit, 4)
+        # Empty values after envsubst fall back to the defaults
+        self.assertEqual(controller.gate(CLASS_READ).limit, 128)
+        self.assertEqual(controller.gate(CLASS_WRITE).limit, 64)
+        self.assertTrue(all(gate.max_queue == 7 for gate in controller.gates()))
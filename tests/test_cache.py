@@ -0,0 +1,68 @@
+import unittest
+
+from services.cache import TTLCache, MISSING
+from tests.timer import FakeTimer
+
+
+class TTLCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.cache = TTLCache(maxsize=3, ttl=10.0, timer=self.timer)
+
+    def test_get_missing_key(self):
+        self.assertIs(self.cache.get('a'), MISSING)
+        self.assertIsNone(self.cache.get('a', None))
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_entry_expires_after_ttl(self):
+        self.cache.set('a', 1)
+        self.timer.now = 9.9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.timer.now = 10.0
+        self.assertIs(self.cache.get('a'), MISSING)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_ttl_per_entry(self):
+        self.cache.set('short', 1, ttl=1.0)
+        self.cache.set('long', 2)
+        self.timer.now = 5.0
+        self.assertIs(self.cache.get('short'), MISSING)
+        self.assertEqual(self.cache.get('long'), 2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for key in 'abc':
+            self.cache.set(key, key)
+        # Reading 'a' makes 'b' the least recently used entry
+        self.cache.get('a')
+        self.cache.set('d', 'd')
+
+        self.assertIs(self.cache.get('b'), MISSING)
+        self.assertEqual([self.cache.get(key) for key in 'acd'], ['a', 'c', 'd'])
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_set_refreshes_existing_entry(self):
+        self.cache.set('a', 1)
+        self.timer.now = 8.0
+        self.cache.set('a', 2)
+        self.timer.now = 15.0
+        self.assertEqual(self.cache.get('a'), 2)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_invalidate_and_clear(self):
+        for key in 'abc':
+            self.cache.set(key, key)
+        self.cache.invalidate('a', 'missing')
+        self.assertIs(self.cache.get('a'), MISSING)
+        self.assertEqual(len(self.cache), 2)
+
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_stats(self):
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        self.cache.get('b')
+        self.assertEqual(self.cache.stats(), {
+            'size': 1, 'maxsize': 3, 'hits': 1, 'misses': 1, 'evictions': 0, 'hit_rate': 0.5,
+        })
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import signal
+import unittest
+from unittest import mock
+
+import aiohttp
+from aiohttp import web
+
+from health import HealthMonitor, health_context
+
+
+def make_app(drain_delay: float) -> web.Application:
+    app = web.Application()
+    app['config'] = {'health': {'drain_delay': drain_delay}, 'postgres': {}}
+    return app
+
+
+class DrainTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        app = make_app(drain_delay=0.3)
+        self.monitor = HealthMonitor(app)
+        app.router.add_get('/readyz', self.readyz)
+
+        runner = web.AppRunner(app, handle_signals=False)
+        await runner.setup()
+        self.addAsyncCleanup(runner.cleanup)
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = 'http://127.0.0.1:%d/readyz' % runner.addresses[0][1]
+
+    async def readyz(self, request: web.Request) -> web.Response:
+        return web.Response(status=503 if self.monitor.shutting_down else 200)
+
+    async def probe(self) -> int:
+        # A new connection per probe, as a balancer health check opens
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(force_close=True)) as session:
+            async with session.get(self.url) as response:
+                return response.status
+
+    async def test_not_ready_is_served_before_the_server_stops(self):
+        self.assertEqual(await self.probe(), 200)
+
+        async def probe_while_draining() -> int:
+            await asyncio.sleep(0.1)
+            return await self.probe()
+
+        probing = asyncio.create_task(probe_while_draining())
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with self.assertRaises(web.GracefulExit):
+            await self.monitor.drain()
+
+        self.assertGreaterEqual(loop.time() - started, 0.3)
+        self.assertEqual(await probing, 503)
+
+    async def test_without_delay_stops_at_once(self):
+        self.monitor.drain_delay = 0.0
+
+        with self.assertRaises(web.GracefulExit):
+            await self.monitor.drain()
+        self.assertTrue(self.monitor.shutting_down)
+
+
+class SigtermHandlerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_sigterm_starts_one_drain(self):
+        app = make_app(drain_delay=0.0)
+        context = health_context(app)
+        await anext(context)
+        self.addAsyncCleanup(anext, context, None)
+
+        with mock.patch.object(HealthMonitor, 'drain', autospec=True) as drain:
+            os.kill(os.getpid(), signal.SIGTERM)
+            await asyncio.sleep(0.05)
+            os.kill(os.getpid(), signal.SIGTERM)
+            await asyncio.sleep(0.05)
+
+        drain.assert_called_once_with(app['health'])
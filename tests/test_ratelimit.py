@@ -0,0 +1,102 @@
+import unittest
+
+from aiohttp import web
+
+from services.ratelimit import LoginThrottle, MemoryBucketStore
+from tests.timer import FakeTimer
+
+
+class MemoryBucketStoreTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.store = MemoryBucketStore(sweep_interval=60.0, timer=self.timer)
+
+    async def test_burst_then_rejected(self):
+        results = [await self.store.take('key', rate=1.0, capacity=3) for _ in range(4)]
+
+        self.assertEqual(results[:3], [2, 1, 0])
+        self.assertLess(results[3], 0)
+
+    async def test_bucket_refills_at_rate(self):
+        for _ in range(3):
+            await self.store.take('key', rate=0.5, capacity=3)
+        self.assertLess(await self.store.take('key', rate=0.5, capacity=3), 0)
+
+        self.timer.now = 2.0
+        self.assertGreaterEqual(await self.store.take('key', rate=0.5, capacity=3), 0)
+        self.assertLess(await self.store.take('key', rate=0.5, capacity=3), 0)
+
+    async def test_refill_is_capped_by_capacity(self):
+        await self.store.take('key', rate=1.0, capacity=2)
+        self.timer.now = 1000.0
+
+        self.assertEqual(await self.store.take('key', rate=1.0, capacity=2), 1)
+
+    async def test_keys_are_independent(self):
+        await self.store.take('a', rate=1.0, capacity=1)
+
+        self.assertLess(await self.store.take('a', rate=1.0, capacity=1), 0)
+        self.assertEqual(await self.store.take('b', rate=1.0, capacity=1), 0)
+
+    async def test_sweep_drops_refilled_buckets(self):
+        await self.store.take('idle', rate=1.0, capacity=5)
+        self.timer.now = 58.0
+        await self.store.take('busy', rate=1.0, capacity=5)
+        self.assertEqual(len(self.store), 2)
+
+        # Past the sweep interval: 'idle' has refilled completely, 'busy' has not
+        self.timer.now = 61.0
+        await self.store.take('other', rate=1.0, capacity=5)
+        self.assertEqual(len(self.store), 2)
+
+
+class LoginThrottleTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.options = {'ip_rate': 1, 'ip_burst': 10, 'user_rate': 0.1, 'user_burst': 2}
+
+    def throttle(self, **options) -> LoginThrottle:
+        return LoginThrottle(MemoryBucketStore(timer=self.timer), {**self.options, **options})
+
+    async def test_username_limit_answers_429_with_retry_after(self):
+        throttle = self.throttle()
+        await throttle.check('admin', '10.0.0.1')
+        await throttle.check('admin', '10.0.0.2')
+
+        with self.assertRaises(web.HTTPTooManyRequests) as raised:
+            await throttle.check('admin', '10.0.0.3')
+        self.assertEqual(raised.exception.headers['Retry-After'], '10')
+
+    async def test_retry_after_is_time_to_next_token_rounded_up(self):
+        for rate, expected in ((0.2, '5'), (0.4, '3')):
+            throttle = self.throttle(user_rate=rate, user_burst=1)
+            await throttle.check(f'user-{rate}', None)
+
+            with self.assertRaises(web.HTTPTooManyRequests) as raised:
+                await throttle.check(f'user-{rate}', None)
+            self.assertEqual(raised.exception.headers['Retry-After'], expected)
+
+    async def test_username_key_length_is_bounded(self):
+        store = MemoryBucketStore(timer=self.timer)
+        throttle = LoginThrottle(store, self.options)
+        await throttle.check('a' * 1000, None)
+        await throttle.check('a' * 1001, None)
+
+        self.assertEqual(len(store), 2)
+        self.assertTrue(all(len(key) <= 200 for key in store._buckets))
+
+    async def test_ip_limit_applies_across_usernames(self):
+        throttle = self.throttle(ip_burst=2)
+        await throttle.check('a', '10.0.0.1')
+        await throttle.check('b', '10.0.0.1')
+
+        with self.assertRaises(web.HTTPTooManyRequests):
+            await throttle.check('c', '10.0.0.1')
+        await throttle.check('c', '10.0.0.2')
+
+    async def test_disabled_throttle_admits_everything(self):
+        throttle = self.throttle(enabled='false')
+        for _ in range(10):
+            await throttle.check('admin', '10.0.0.1')
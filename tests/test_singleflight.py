@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+
+from services.singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight('test')
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def lookup(self, value: str = 'result') -> str:
+        self.calls += 1
+        await self.release.wait()
+        return value
+
+    async def test_concurrent_calls_share_one_lookup(self):
+        tasks = [asyncio.create_task(self.flight.do('key', self.lookup)) for _ in range(5)]
+        await asyncio.sleep(0)
+        self.release.set()
+
+        self.assertEqual(await asyncio.gather(*tasks), ['result'] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flight.stats()['in_flight'], 0)
+
+    async def test_different_keys_are_not_merged(self):
+        tasks = [asyncio.create_task(self.flight.do(key, self.lookup)) for key in ('a', 'b')]
+        await asyncio.sleep(0)
+        self.release.set()
+
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.calls, 2)
+
+    async def test_error_is_raised_in_every_caller(self):
+        async def failing() -> None:
+            await self.release.wait()
+            raise ValueError('lookup failed')
+
+        tasks = [asyncio.create_task(self.flight.do('key', failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.release.set()
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(self.flight.stats()['in_flight'], 0)
+
+    async def test_waiter_repeats_lookup_when_leader_is_cancelled(self):
+        leader = asyncio.create_task(self.flight.do('key', self.lookup))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(self.flight.do('key', self.lookup))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual(await waiter, 'result')
+        self.assertEqual(self.calls, 2)
+
+    async def test_cancelled_waiter_does_not_cancel_leader(self):
+        leader = asyncio.create_task(self.flight.do('key', self.lookup))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(self.flight.do('key', self.lookup))
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.release.set()
+
+        self.assertEqual(await leader, 'result')
+        self.assertEqual(self.calls, 1)
+
+    async def test_call_after_forget_does_not_join_earlier_lookup(self):
+        stale = asyncio.create_task(self.flight.do('key', lambda: self.lookup('before write')))
+        await asyncio.sleep(0)
+
+        # A write happened: the next reader must not get the result of the lookup started before it
+        self.flight.forget('key')
+        fresh = asyncio.create_task(self.flight.do('key', lambda: self.lookup('after write')))
+        await asyncio.sleep(0)
+        self.release.set()
+
+        self.assertEqual(await stale, 'before write')
+        self.assertEqual(await fresh, 'after write')
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.flight.stats()['in_flight'], 0)
+
+    async def test_calls_past_max_keys_bypass_tracking(self):
+        flight = SingleFlight('test', max_keys=1)
+        first = asyncio.create_task(flight.do('a', self.lookup))
+        await asyncio.sleep(0)
+        bypassed = [asyncio.create_task(flight.do('b', self.lookup)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        self.assertEqual(flight.stats()['in_flight'], 1)
+        self.release.set()
+        await asyncio.gather(first, *bypassed)
+        self.assertEqual(self.calls, 3)
@@ -0,0 +1,8 @@
+class FakeTimer:
+    """ Управляемые часы для TTLCache и MemoryBucketStore """
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now